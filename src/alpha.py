@@ -2,57 +2,65 @@ import numpy as np
 import pandas as pd
 import argparse
 import os
-from fair_solver import fair_l1_solution, fair_maxmin_solution, fair_l2_solution 
-from random_solver import process_solutions
+from fair_solver import fair_l1_solution, fair_maxmin_solution, fair_l2_solution, fair_l2_gradient_solution
+from instance_context import InstanceContext, load_pool_data
+import metrics
+from metrics import HARD_TO_MATCH, ProductDistribution, patient_marginals, expected_opt
+from parallel import run_tasks
+from lp_backend import BACKENDS
+from result_cache import ResultCache, fair_distribution, DEFAULT_CACHE_DIR
 
 
-def uniform(solution_file, num_patients):
-    with open(solution_file, 'r') as f:
-        lines = f.readlines()
-        num_solutions = len(lines)
+def uniform(solutions, num_patients, backend=None, presolve=True):
+    # every solution of the pool is equally likely, duplicates included (backend and presolve are not used)
+    data = load_pool_data(solutions, num_patients)
+    if data.factored:
+        # the multiplicity of a product is the product of the multiplicities of its parts
+        return ProductDistribution([c.counts / c.counts.sum() for c in data.components])
+    counts = data.counts
 
-        return [1 / num_solutions for _ in range(num_solutions)]
+    return counts / counts.sum()
 
 
-def compute_properties(graph_file, solution_file, num_patients, fair_alg):
-    with open(graph_file, 'r') as f:
-        pra_idx = f.readline().strip('\n').split('\t').index('%PRA')
+def compute_properties(graph_file, solution_file, num_patients, fair_alg, thresholds=HARD_TO_MATCH, backend=None, cache=None,
+        settings=None):
+    # the files are parsed once and shared by every method and loss
+    context = InstanceContext(graph_file, solution_file, num_patients)
 
-        pra_dict = dict()
+    probs = fair_distribution(cache, context, num_patients, fair_alg, backend, settings)
+    marginals = patient_marginals(context.incidence, probs, num_patients)
+    
+    return metrics.alpha(marginals, context.pra, thresholds), expected_opt(marginals)
 
-        for i in range(num_patients):
-            pra_dict[i] = float(f.readline().strip('\n').split('\t')[pra_idx])
 
-    solutions = process_solutions(solution_file)
-    num_solutions = len(solutions)
-    solution_prob_dict = fair_alg(solution_file, num_patients)
-    hard_to_match = [sum([1 for i in sol if pra_dict[i] >= 0.8]) for sol in solutions]
-    expectation = sum([hard_to_match[i] * solution_prob_dict[i] for i in range(num_solutions)])
-    num_hard_to_match = len([i for i, val in pra_dict.items() if val >= 0.8])
-    alpha = expectation / num_hard_to_match if num_hard_to_match > 0 else 0.0
-    
-    return alpha, np.mean([len(sol) for sol in solutions])
+def profile_task(task, backend):
+    graph_file, solution_file, size, fair_alg, cache, settings = task
+    return compute_properties(graph_file, solution_file, size, fair_alg, backend=backend, cache=cache, settings=settings)
 
 
-def instances_profile(loss, sizes=[20,30,40,50,60,70]):
+def instances_profile(loss, sizes=[20,30,40,50,60,70], workers=1, threads=None, cache=None, backend='gurobi', presolve=True):
     if loss == 'l1':
         fair_alg = fair_l1_solution
     elif loss == 'maxmin':
         fair_alg = fair_maxmin_solution
     elif loss == 'l2':
         fair_alg = fair_l2_solution
+    elif loss == 'l2-gradient':
+        fair_alg = fair_l2_gradient_solution
+    # part of the key of the cached distributions
+    settings = {'presolve': presolve}
+    if loss in ['l2', 'l2-gradient']:
+        settings['l2_solver'] = 'qp' if loss == 'l2' else 'gradient'
     df = {}
 
+    # every (method, size, instance) is an independent task
     methods = ['base_', 'group_fairness', 'first_best', 'uniform']
+    tasks = {}
     for method in methods:
         if method == 'uniform':
             fair_alg = uniform
         
         for size in sizes:
-            alphas = []
-            opts = []
-            instances = []
-
             for i in range(1,51):
                 file_id = 2 * (i + (size - 20) // 10 * 50)
                 graph_file = '../PortoInstances/{}-instance-{}-type-information.input'.format(size, i)
@@ -62,13 +70,15 @@ def instances_profile(loss, sizes=[20,30,40,50,60,70]):
                     continue
                 elif not os.path.isfile(solution_file):
                     continue
-                instances.append(file_id)
-                
-                alpha, opt = compute_properties(graph_file, solution_file, size, fair_alg)
+                tasks[(method, size, file_id)] = (graph_file, solution_file, size, fair_alg, cache, settings)
 
-                alphas.append(alpha)
-                opts.append(opt)
+    results = dict(zip(tasks.keys(), run_tasks(profile_task, list(tasks.values()), workers, threads, backend)))
 
+    for method in methods:
+        for size in sizes:
+            instances = [file_id for (method_, size_, file_id) in tasks.keys() if method_ == method and size_ == size]
+            alphas = [results[(method, size, file_id)][0] for file_id in instances]
+            opts = [results[(method, size, file_id)][1] for file_id in instances]
 
             col_names = pd.MultiIndex.from_product([['alpha', 'OPT'], [method]])
             df_ = pd.DataFrame(data=np.transpose([alphas, opts]), index=instances, columns=col_names)
@@ -104,8 +114,19 @@ def compute_statistics(df, val):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--loss', type=str, help="The loss that is optimized to get probability distribution")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--threads', type=int, default=None,
+            help="Number of solver threads of each worker (default: 1 with several workers, the solver's default otherwise)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='gurobi', help="Solver of the fairness LPs")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Directory where the distributions are cached")
+    parser.add_argument('--no-cache', action='store_true', help="Always solve the fairness problems")
+    parser.add_argument('--no-presolve', action='store_true', help="Solve the fairness problems over the whole pools")
     args = parser.parse_args()
-    d = instances_profile(args.loss, [20, 30, 40, 50, 60, 70])
+    if args.loss == 'l2' and args.backend != 'gurobi':
+        parser.error("the l2 loss is a QP that only gurobi solves, use --loss l2-gradient with --backend %s" % args.backend)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    d = instances_profile(args.loss, [20, 30, 40, 50, 60, 70], args.workers, args.threads, cache, args.backend,
+            not args.no_presolve)
     
     print(compute_statistics(d, 'alpha').to_latex(), '\n')
     print(compute_statistics(d, 'OPT').to_latex())
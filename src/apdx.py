@@ -1,47 +1,42 @@
-import numpy as np
 import pandas as pd
 import argparse
 import os
-from fair_solver import fair_l1_solution, fair_maxmin_solution, fair_l2_solution 
-from random_solver import process_solutions
+from fair_solver import fair_l1_solution, fair_maxmin_solution, fair_l2_solution, fair_l2_gradient_solution
+from instance_context import InstanceContext, load_pool_data
+from metrics import ProductDistribution, patient_marginals, group_averages
+from parallel import run_tasks
+from lp_backend import BACKENDS
+from result_cache import ResultCache, fair_distribution, DEFAULT_CACHE_DIR
 
 
-def uniform(solution_file, num_patients):
-    with open(solution_file, 'r') as f:
-        lines = f.readlines()
-        num_solutions = len(lines)
+def uniform(solutions, num_patients, backend=None, presolve=True):
+    # every solution of the pool is equally likely, duplicates included (backend and presolve are not used)
+    data = load_pool_data(solutions, num_patients)
+    if data.factored:
+        # the multiplicity of a product is the product of the multiplicities of its parts
+        return ProductDistribution([c.counts / c.counts.sum() for c in data.components])
+    counts = data.counts
 
-        return [1.0 / num_solutions]
+    return counts / counts.sum()
 
 
-def compute_properties(graph_file, solution_file, num_patients, fair_alg):
-    with open(graph_file, 'r') as f:
-        pra_idx = f.readline().strip('\n').split('\t').index('%PRA')
+def compute_properties(graph_file, solution_file, num_patients, fair_alg, backend=None, cache=None, settings=None):
+    # the files are parsed once and shared by every method and loss
+    context = InstanceContext(graph_file, solution_file, num_patients)
+    pra_dict = dict(enumerate(context.pra.tolist()))
 
-        pra_dict = dict()
+    solutions = context.solutions
+    # probability of each solution, indexed like a dictionary by patients_in_sols
+    solution_prob_dict = fair_distribution(cache, context, num_patients, fair_alg, backend, settings)
+    marginals = patient_marginals(context.incidence, solution_prob_dict, num_patients)
 
-        for i in range(num_patients):
-            pra_dict[i] = float(f.readline().strip('\n').split('\t')[pra_idx])
-
-    solutions = process_solutions(solution_file)
-    num_solutions = len(solutions)
-    solution_prob_dict = fair_alg(solution_file, num_patients)
-
-    # hard-to-match avg probability
-    hard_to_match = [sum([solution_prob_dict[sid] for sid, sval in enumerate(solutions) if i in sval]) for i in pra_dict.keys() if pra_dict[i] >= 0.8]
-    num_hard_to_match = len([i for i, val in pra_dict.items() if val >= 0.8])
-    hardpct = sum(hard_to_match) / num_hard_to_match if num_hard_to_match > 0 else np.nan 
-    
-    # easy-to-match avg probability
-    easy_to_match = [sum([solution_prob_dict[sid] for sid, sval in enumerate(solutions) if i in sval]) for i in pra_dict.keys() if pra_dict[i] < 0.8]
-    num_easy_to_match = len([i for i, val in pra_dict.items() if val < 0.8])
-    easypct = sum(easy_to_match) / num_easy_to_match if num_easy_to_match > 0 else np.nan 
+    # easy-to-match and hard-to-match avg probability
+    easypct, hardpct = group_averages(marginals, context.pra)
     
     return solutions, solution_prob_dict, pra_dict, easypct, hardpct
 
 
 def patients_in_sols(solutions, solution_prob_dict, pra_dict):
-    num_V = len(pra_dict.keys())
     patients = set()
     easy_patients = set()
     hard_patients = set([v for v in pra_dict.keys() if pra_dict[v] >= 0.8])
@@ -84,30 +79,38 @@ def patients_in_sols(solutions, solution_prob_dict, pra_dict):
     return val, easy_val, hard_val, structural_val, num_structural
 
 
-def instances_profile(loss, sizes):
+def profile_task(task, backend):
+    graph_file, solution_file, size, fair_alg, cache, settings = task
+    solutions, solution_prob_dict, pra_dict, easypct, hardpct = \
+            compute_properties(graph_file, solution_file, size, fair_alg, backend=backend, cache=cache, settings=settings)
+    val, easy_val, hard_val, structural_val, num_structural = patients_in_sols(solutions, solution_prob_dict, pra_dict)
+    return easypct, hardpct, val, easy_val, hard_val, structural_val
+
+
+def instances_profile(loss, sizes, workers=1, threads=None, cache=None, backend='gurobi', presolve=True):
     if loss == 'l1':
         fair_alg = fair_l1_solution
     elif loss == 'maxmin':
         fair_alg = fair_maxmin_solution
     elif loss == 'l2':
         fair_alg = fair_l2_solution
+    elif loss == 'l2-gradient':
+        fair_alg = fair_l2_gradient_solution
+    # part of the key of the cached distributions
+    settings = {'presolve': presolve}
+    if loss in ['l2', 'l2-gradient']:
+        settings['l2_solver'] = 'qp' if loss == 'l2' else 'gradient'
     patients_relaxed = {}
     pct_in_sol = {}
 
+    # every (method, size, instance) is an independent task
     methods = ['relaxed', 'group_fairness']
+    tasks = {}
     for method in methods:
         if method == 'uniform':
             fair_alg = uniform
         
         for size in sizes:
-            easypcts = []
-            hardpcts = []
-            vals = []
-            easy_vals = []
-            hard_vals = []
-            structural_vals = []
-            instances = []
-
             for i in range(1,51):
                 file_id = 2 * (i + (size - 20) // 10 * 50)
                 graph_file = '../PortoInstances/{}-instance-{}-type-information.input'.format(size, i)
@@ -117,19 +120,15 @@ def instances_profile(loss, sizes):
                     continue
                 elif not os.path.isfile(solution_file):
                     continue
-                instances.append(file_id)
-               
-                solutions, solution_prob_dict, pra_dict, easypct, hardpct = \
-                        compute_properties(graph_file, solution_file, size, fair_alg)
+                tasks[(method, size, file_id)] = (graph_file, solution_file, size, fair_alg, cache, settings)
 
-                val, easy_val, hard_val, structural_val, num_structural = patients_in_sols(solutions, solution_prob_dict, pra_dict)
-                vals.append(val)
-                easy_vals.append(easy_val)
-                hard_vals.append(hard_val)
-                structural_vals.append(structural_val)
-                easypcts.append(easypct)
-                hardpcts.append(hardpct)
+    results = dict(zip(tasks.keys(), run_tasks(profile_task, list(tasks.values()), workers, threads, backend)))
 
+    for method in methods:
+        for size in sizes:
+            instances = [file_id for (method_, size_, file_id) in tasks.keys() if method_ == method and size_ == size]
+            easypcts, hardpcts, vals, easy_vals, hard_vals, structural_vals = \
+                    [list(column) for column in zip(*[results[(method, size, file_id)] for file_id in instances])]
 
             pct_in_sol_ = pd.DataFrame(data={'easy':easypcts, 'hard':hardpcts}, index=instances)
             if size not in pct_in_sol:
@@ -174,7 +173,18 @@ def compute_statistics(patients_relaxed, pct_in_sol) :
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--loss', type=str, help="The loss that is optimized to get probability distribution")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--threads', type=int, default=None,
+            help="Number of solver threads of each worker (default: 1 with several workers, the solver's default otherwise)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='gurobi', help="Solver of the fairness LPs")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Directory where the distributions are cached")
+    parser.add_argument('--no-cache', action='store_true', help="Always solve the fairness problems")
+    parser.add_argument('--no-presolve', action='store_true', help="Solve the fairness problems over the whole pools")
     args = parser.parse_args()
-    patients_relaxed_dict, pct_in_sol_dict = instances_profile(args.loss, range(20,70,10))
+    if args.loss == 'l2' and args.backend != 'gurobi':
+        parser.error("the l2 loss is a QP that only gurobi solves, use --loss l2-gradient with --backend %s" % args.backend)
+    cache = None if args.no_cache else ResultCache(args.cache_dir)
+    patients_relaxed_dict, pct_in_sol_dict = instances_profile(args.loss, range(20,70,10), args.workers, args.threads, cache, args.backend,
+            not args.no_presolve)
     
     compute_statistics(patients_relaxed_dict, pct_in_sol_dict)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""
+Python 3
+REQUIREMENTS: GUROBI (optional, see --no-gurobi)
+Benchmark of the pipeline of kep_mip on the Canadian and Porto instances.
+
+Every instance is run in a fresh process, through the stages
+    parse, cycles, build, optimize, pool, extract, write
+of kep_mip (build_KEP and solve_pool), which record themselves in the active
+profiler (see profiling.Profiler). For each stage the wall time, the RSS at its
+end and the peak RSS of the process so far are recorded, with the number of cycles,
+variables, constraints and solutions, and the statistics and Gurobi work units
+of the optimize calls. The stages that need Gurobi (build to write) are skipped with
+--no-gurobi or when gurobipy can not be imported, so that parsing and cycle
+enumeration can be measured anywhere.
+
+Before the instances, the time of loading every instance and type-information
+file from its kep_io cache is measured (load), in a fresh process once the
+caches are filled.
+
+The results are written as JSON and can be compared with a previous run: a
+stage (or the load) whose time or peak RSS grew by more than the threshold is
+reported as a regression, as well as any change in the counts, and the exit
+status is 1.
+"""
+import sys, os, glob, json, time, argparse, tempfile, platform
+from multiprocessing import Pool
+
+from kep_io import read_kep, load_graph, load_types, CACHE_SUFFIX
+from pief import FORMULATIONS
+import profiling
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_INSTANCES = ['CanadianInstances/Graph_*', 'PortoInstances/*-instance-*.input']
+STAGES = ['parse', 'cycles', 'build', 'optimize', 'pool', 'extract', 'write']
+GUROBI_STAGES = STAGES[2:]
+COUNTS = ['cycles', 'variables', 'constraints', 'solutions']
+
+
+def _have_gurobi():
+    try:
+        import gurobipy
+        return True
+    except ImportError:
+        return False
+
+
+# INPUT
+# filename - instance file
+# config - dictionary of the options of the run
+# OUTPUT
+# dictionary with the stages, the counts and the skipped stages of the instance, and the error and
+# the failed stage (which is skipped) if a stage raised
+def run_instance(filename, config):
+    # the stages of kep_mip record themselves in the active profiler
+    rec = profiling.enable(config.get('trace_memory', False))
+    try:
+        return _profile_instance(rec, filename, config)
+    finally:
+        profiling.disable()
+
+
+def _profile_instance(rec, filename, config):
+    counts = {}
+    K, L = config['cycle_limit'], config['chain_limit']
+
+    G, num_V, Nb_arcs, altruistic_list = rec.run('parse', read_kep, filename)
+    if not config['gurobi']:
+        from cycles import get_all_cycles
+        from pief import pief_arcs
+        enumerate_cycles = pief_arcs if config['formulation'] == 'pief' else get_all_cycles
+        counts['cycles'] = len(rec.run('cycles', enumerate_cycles, G, K))
+        return {'stages': rec.stages, 'counts': counts, 'skipped': GUROBI_STAGES}
+
+    from kep_mip import build_KEP, solve_pool
+    from budget import Budget, PoolMonitor
+    from pool_io import save_to_file
+
+    result = {'stages': rec.stages, 'counts': counts, 'skipped': [], 'models': rec.models}
+    try:
+        m, X, Z, Cycles_k = build_KEP(G, K, L, altruistic_list, config['formulation'])
+        counts['cycles'] = len(Cycles_k)
+        counts['variables'] = m.NumVars
+        counts['constraints'] = m.NumConstrs
+        # the pool is partial if the time limit was reached
+        monitor = PoolMonitor(Budget(time_limit=config['time_limit']))
+        _, solutions, result['pool_complete'] = solve_pool(m, X, Cycles_k, monitor)
+        solutions = list(solutions)
+        counts['solutions'] = len(solutions)
+        with tempfile.TemporaryDirectory() as tmp:
+            # the labels may start at 1 (Canadian instances): len(G) bounds them, num_V does not
+            rec.run('write', save_to_file, os.path.join(tmp, 'pool'), solutions, config['pool_format'] == 'binary', len(G))
+    except Exception as e:
+        # e.g. a model too large for the license: the stages done so far are kept, the
+        # time of the failed stage is dropped as it is not comparable with a complete one
+        result['error'] = str(e)
+        if rec.failed is not None:
+            result['failed'] = rec.failed
+            rec.stages.pop(rec.failed, None)
+        result['skipped'] = [stage for stage in GUROBI_STAGES if stage not in rec.stages]
+    return result
+
+
+def _run(args):
+    name, filename, config = args
+    return name, run_instance(filename, config)
+
+
+# INPUT
+# patterns - globs of instance files, relative to the root of the repository
+# limit - maximum number of files of each glob (None for all)
+# OUTPUT
+# list of (name, path) pairs
+def find_instances(patterns, limit=None):
+    instances = []
+    for pattern in patterns:
+        files = sorted(f for f in glob.glob(os.path.join(ROOT, pattern))
+                if CACHE_SUFFIX not in f and not f.endswith('-type-information.input'))
+        instances.extend((os.path.relpath(f, ROOT), f) for f in files[:limit])
+    return instances
+
+
+def type_file(filename):
+    # type-information file of a Porto instance, None if there is none
+    path = filename[:-len('.input')] + '-type-information.input' if filename.endswith('.input') else None
+    return path if path is not None and os.path.isfile(path) else None
+
+
+def warm_load(filenames):
+    """
+    :param filenames: instance files
+    :return: dictionary with the number of files (instances and type-information files) and the time of
+        loading them all from their kep_io caches, once the caches are filled
+    """
+    files = [(load_graph, f) for f in filenames] + [(load_types, type_file(f)) for f in filenames if type_file(f)]
+    for load, f in files:
+        load(f)
+    start = time.perf_counter()
+    for load, f in files:
+        load(f)
+    return {'files': len(files), 'time': time.perf_counter() - start}
+
+
+def run_benchmark(instances, config):
+    """
+    :param instances: list of (name, path) pairs
+    :param config: dictionary of the options of the run
+    :return: dictionary with the configuration, the warm load of all the files and the results of every instance
+    """
+    results = {}
+    # in its own process, so that nothing is loaded yet
+    with Pool(1) as pool:
+        load = pool.apply(warm_load, ([path for _, path in instances],))
+    print('warm load of %d files: %.3fs' % (load['files'], load['time']), file=sys.stderr)
+    # one process per instance, so that its peak RSS is its own
+    with Pool(1, maxtasksperchild=1) as pool:
+        for name, result in pool.imap(_run, [(name, path, config) for name, path in instances]):
+            results[name] = result
+            total = sum(stage['time'] for stage in result['stages'].values())
+            print('%s: %.3fs %s%s' % (name, total, ' '.join('%s=%d' % item for item in sorted(result['counts'].items())),
+                    ' (%s)' % result['error'] if 'error' in result else ''), file=sys.stderr)
+    return {'config': config, 'machine': platform.node(), 'load': load, 'instances': results}
+
+
+def compare(results, baseline, threshold=0.25, min_time=0.05):
+    """
+    :param results: output of run_benchmark
+    :param baseline: output of run_benchmark of the reference run
+    :param threshold: relative increase of time or peak RSS reported as a regression
+    :param min_time: stages faster than this (seconds) in both runs are not compared on time
+    :return: list of the regressions, as strings
+    """
+    regressions = []
+    new, old = results.get('load'), baseline.get('load')
+    if new is not None and old is not None and new['files'] == old['files']:
+        if max(new['time'], old['time']) >= min_time and new['time'] > old['time'] * (1 + threshold):
+            regressions.append('warm load of %d files: time %.3fs -> %.3fs' % (new['files'], old['time'], new['time']))
+    for name, result in sorted(results['instances'].items()):
+        if name not in baseline['instances']:
+            continue
+        base = baseline['instances'][name]
+        if 'failed' in result and 'failed' not in base:
+            regressions.append('%s: %s failed (%s)' % (name, result['failed'], result['error']))
+        for key in COUNTS:
+            # a pool stopped by the time limit has no meaningful size
+            if key == 'solutions' and not (result.get('pool_complete') and base.get('pool_complete')):
+                continue
+            if key in result['counts'] and key in base['counts'] and result['counts'][key] != base['counts'][key]:
+                regressions.append('%s: %s changed from %d to %d' % (name, key, base['counts'][key], result['counts'][key]))
+        for stage, new in result['stages'].items():
+            old = base['stages'].get(stage)
+            # a stage that failed in either run is not comparable
+            if old is None or stage in (result.get('failed'), base.get('failed')):
+                continue
+            if max(new['time'], old['time']) >= min_time and new['time'] > old['time'] * (1 + threshold):
+                regressions.append('%s: %s time %.3fs -> %.3fs' % (name, stage, old['time'], new['time']))
+            if old['peak_rss'] > 0 and new['peak_rss'] > old['peak_rss'] * (1 + threshold):
+                regressions.append('%s: %s peak RSS %.1fMB -> %.1fMB' % (name, stage, old['peak_rss'] / 2**20, new['peak_rss'] / 2**20))
+    return regressions
+
+
+def summary(results):
+    # total time of every stage over the instances
+    totals = {}
+    for result in results['instances'].values():
+        for stage, values in result['stages'].items():
+            totals[stage] = totals.get(stage, 0.0) + values['time']
+    return {stage: totals[stage] for stage in STAGES if stage in totals}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--instances', nargs='+', default=DEFAULT_INSTANCES,
+            help="globs of instance files, relative to the root of the repository")
+    parser.add_argument('--limit', type=int, default=None, help="maximum number of files of each glob")
+    parser.add_argument('--cycle-limit', type=int, default=3)
+    parser.add_argument('--chain-limit', type=int, default=3)
+    parser.add_argument('--cycle-formulation', choices=FORMULATIONS, default='cycle')
+    parser.add_argument('--pool-format', choices=['text', 'binary'], default='text')
+    parser.add_argument('--time-limit', type=float, default=None, help="time budget of the optimize and pool stages (seconds)")
+    parser.add_argument('--no-gurobi', action='store_true', help="only run the parse and cycles stages")
+    parser.add_argument('--trace-memory', action='store_true',
+            help="also record the peak of the Python allocations of every stage (tracemalloc, slower)")
+    parser.add_argument('--output', default='benchmark.json', help="file where the results are written")
+    parser.add_argument('--baseline', default=None, help="results of a previous run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.25, help="relative increase reported as a regression")
+    args = parser.parse_args()
+
+    config = {'cycle_limit': args.cycle_limit, 'chain_limit': args.chain_limit,
+            'formulation': args.cycle_formulation, 'pool_format': args.pool_format,
+            'time_limit': args.time_limit, 'gurobi': not args.no_gurobi and _have_gurobi(),
+            'trace_memory': args.trace_memory}
+    if not args.no_gurobi and not config['gurobi']:
+        print('gurobipy is not available, the stages %s are skipped' % ', '.join(GUROBI_STAGES), file=sys.stderr)
+
+    results = run_benchmark(find_instances(args.instances, args.limit), config)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+    print('%-10s %10.3fs (%d files)' % ('load', results['load']['time'], results['load']['files']))
+    for stage, total in summary(results).items():
+        print('%-10s %10.3fs' % (stage, total))
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config:
+            print('warning: the baseline was run with %s' % baseline['config'], file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,170 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Resource budgets and progress telemetry of the pool enumerations.
+
+A PoolMonitor is passed as the callback of every optimize call of a run. It
+stops the run (model.terminate) when the wall time since its creation or the
+resident memory of the process exceed their budget. The pool search is capped
+one solution above the budget of solutions and runs to its end, so that a pool
+of exactly max_solutions solutions is complete, while a pool that reaches the
+cap is partial and only its best max_solutions solutions are extracted. The
+monitor appends to a JSONL log, at most once per interval, the solutions found,
+the best objective and bound, the nodes explored, the elapsed time and the RSS.
+When a budget stops a run the pool is partial: the solvers keep the solutions
+found with the optimal (or best known) objective and return a completion flag.
+
+Telemetry records, one JSON object per line:
+    {"event": "progress", "label", "phase", "elapsed", "solutions", "best", "bound", "nodes", "rss"}
+    {"event": "stop", "label", "phase", "elapsed", "reason"}    reason: "time", "solutions" or "memory"
+    {"event": "done", "label", "elapsed", "complete", "solutions", "reason"}
+"""
+import json, time
+
+from gurobipy import GRB
+
+import profiling
+from profiling import current_rss
+
+
+class Budget(object):
+    """
+    Limits of a run, None for no limit.
+    """
+
+    def __init__(self, time_limit=None, max_solutions=None, max_memory=None):
+        """
+        :param time_limit: wall time in seconds
+        :param max_solutions: number of solutions of the pool
+        :param max_memory: resident memory of the process in bytes
+        """
+        self.time_limit = time_limit
+        self.max_solutions = max_solutions
+        self.max_memory = max_memory
+
+
+class PoolMonitor(object):
+    """
+    Gurobi callback enforcing a Budget and writing the telemetry of a run.
+    """
+
+    def __init__(self, budget=None, log=None, interval=1.0, label=''):
+        """
+        :param budget: Budget, None for no limit
+        :param log: filename of the JSONL telemetry (appended to), None for no telemetry
+        :param interval: minimum number of seconds between two progress records
+        :param label: name of the run in the records, e.g. the instance
+        """
+        self.budget = budget if budget is not None else Budget()
+        self.log = open(log, 'a') if log is not None else None
+        self.interval = interval
+        self.label = label
+        self.phase = 'optimize'
+        self.start = time.time()
+        self.last = None
+        self.last_rss = 0.0
+        self.rss = current_rss()
+        self.reason = None
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def write(self, record):
+        if self.log is not None:
+            record = dict(record, label=self.label, elapsed=round(self.elapsed(), 3))
+            self.log.write(json.dumps(record) + '\n')
+            self.log.flush()
+
+    def __call__(self, model, where):
+        if where != GRB.Callback.MIP:
+            return
+        now = time.time()
+        # reading /proc is cheap, but the MIP callback is called very often
+        if now - self.last_rss >= 0.1:
+            self.rss = current_rss()
+            self.last_rss = now
+        solutions = int(model.cbGet(GRB.Callback.MIP_SOLCNT))
+        if self.last is None or now - self.last >= self.interval:
+            self.last = now
+            self.write({'event': 'progress', 'phase': self.phase, 'solutions': solutions,
+                    'best': model.cbGet(GRB.Callback.MIP_OBJBST), 'bound': model.cbGet(GRB.Callback.MIP_OBJBND),
+                    'nodes': model.cbGet(GRB.Callback.MIP_NODCNT), 'rss': self.rss})
+        budget = self.budget
+        if budget.time_limit is not None and now - self.start >= budget.time_limit:
+            self.stop(model, 'time')
+        elif budget.max_memory is not None and self.rss >= budget.max_memory:
+            self.stop(model, 'memory')
+
+    def stop(self, model, reason):
+        self.record_stop(reason)
+        model.terminate()
+
+    def record_stop(self, reason):
+        if self.reason is None:
+            self.reason = reason
+            self.write({'event': 'stop', 'phase': self.phase, 'reason': reason})
+
+    def optimize(self, model, phase):
+        """
+        Optimize the model under the budget, unless it is already exhausted.
+        :param model: gurobi model
+        :param phase: name of the optimize call in the telemetry
+        :return: True if the model was solved to optimality
+        """
+        self.phase = phase
+        if self.reason is None:
+            if phase == 'pool' and self.budget.max_solutions is not None:
+                # the pool search keeps the best solutions, one more than the budget tells a
+                # pool truncated by the cap from a pool of exactly max_solutions solutions
+                model.setParam("PoolSolutions", self.budget.max_solutions + 1)
+            if self.budget.time_limit is not None:
+                # in case the MIP callback is not called, e.g. while solving the root
+                model.setParam("TimeLimit", max(self.budget.time_limit - self.elapsed(), 0.0))
+            profiling.optimize(model, phase, self)
+            if model.Status == GRB.TIME_LIMIT:
+                self.record_stop('time')
+            elif phase == 'pool' and self.budget.max_solutions is not None and model.SolCount > self.budget.max_solutions:
+                self.record_stop('solutions')
+        return self.reason is None and model.Status == GRB.OPTIMAL
+
+    @property
+    def max_solutions(self):
+        # number of solutions to extract from the pool (None for all), see kep_model.extract_pool
+        return self.budget.max_solutions
+
+    def done(self, complete, solutions):
+        """
+        :param complete: True if the pool is complete
+        :param solutions: number of solutions written
+        """
+        self.write({'event': 'done', 'complete': complete, 'solutions': solutions, 'reason': self.reason})
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def add_budget_arguments(parser):
+    # options of the budgets and telemetry of the pool enumerations
+    parser.add_argument('--time-budget', type=float, default=None, help="Wall time budget of the run (seconds)")
+    parser.add_argument('--pool-budget', type=int, default=None, help="Maximum number of solutions of the pool")
+    parser.add_argument('--memory-budget', type=float, default=None, help="Maximum resident memory (MB)")
+    parser.add_argument('--telemetry', default=None, help="JSONL file where the progress of the run is appended")
+    parser.add_argument('--telemetry-interval', type=float, default=1.0, help="Seconds between two progress records")
+
+
+def budget_from_args(args):
+    """
+    :param args: arguments parsed with the options of add_budget_arguments
+    :return: Budget
+    """
+    max_memory = None if args.memory_budget is None else int(args.memory_budget * 2**20)
+    return Budget(args.time_budget, args.pool_budget, max_memory)
+
+
+def monitor_from_args(args, label=''):
+    """
+    :param args: arguments parsed with the options of add_budget_arguments
+    :param label: name of the run in the telemetry
+    :return: PoolMonitor
+    """
+    return PoolMonitor(budget_from_args(args), args.telemetry, args.telemetry_interval, label)
@@ -0,0 +1,185 @@
+"""
+Python 3
+Enumeration of all the cycles of length at most K of a directed graph.
+
+Every cycle is generated exactly once, starting from its smallest vertex, by an
+iterative DFS that only visits vertices larger than the start. The search is
+pruned with the distance from each vertex back to the start, so a partial path
+is only extended when it can still be closed within K vertices.
+
+cycles_through enumerates the cycles through a single vertex in the same way,
+for the incremental updates of a changing graph (see simulation.py).
+"""
+from array import array
+from collections import deque
+
+import numpy as np
+
+
+class CycleSet(object):
+    """
+    Compact container of cycles stored in CSR form: the vertices of cycle i are
+    vertices[offsets[i]:offsets[i+1]], beginning with the smallest vertex.
+    Indexing returns a tuple, so a CycleSet can be used wherever a list of
+    cycles was used before.
+    """
+
+    def __init__(self, vertices, offsets):
+        self.vertices = np.asarray(vertices, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return tuple(self.vertices[self.offsets[i]:self.offsets[i+1]].tolist())
+
+    def __iter__(self):
+        vertices = self.vertices.tolist()
+        offsets = self.offsets.tolist()
+        for i in range(len(offsets) - 1):
+            yield tuple(vertices[offsets[i]:offsets[i+1]])
+
+    def lengths(self):
+        """
+        :return: array with the number of vertices of each cycle
+        """
+        return np.diff(self.offsets)
+
+    def totals(self, values):
+        """
+        Sum of a value of the vertices over each cycle.
+        :param values: array indexed by the vertex labels
+        :return: array with the total of each cycle
+        """
+        values = np.asarray(values, dtype=np.float64)
+        cycle = np.repeat(np.arange(len(self)), self.lengths())
+        return np.bincount(cycle, weights=values[self.vertices], minlength=len(self))
+
+    def members(self, idx):
+        """
+        Vertices of the cycles in idx, concatenated in the order of idx.
+        :param idx: array of cycle indices
+        :return: array of vertices
+        """
+        idx = np.asarray(idx, dtype=np.int64)
+        starts = self.offsets[idx]
+        lengths = self.offsets[idx+1] - starts
+        if lengths.sum() == 0:
+            return self.vertices[:0]
+        # position of every output element inside self.vertices
+        pos = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.vertices[pos]
+
+
+def _index_graph(adj):
+    # relabel the vertices as 0..n-1 (keeping their order) and drop repeated arcs and loops
+    labels = sorted(set(adj.keys()).union(j for i in adj for j in adj[i]))
+    index = {v: k for k, v in enumerate(labels)}
+    succ = [[] for _ in labels]
+    for i in adj:
+        succ[index[i]] = sorted(set(index[j] for j in adj[i]) - {index[i]})
+    return labels, succ
+
+
+# INPUT
+# adj - incidence list; a dictionary
+# K - maximum size for cycles length
+# OUTPUT
+# cycles - CycleSet with every cycle of length 2..K
+def get_all_cycles(adj, K):
+    labels, succ = _index_graph(adj)
+    n = len(labels)
+    pred = [[] for _ in range(n)]
+    for i in range(n):
+        for j in succ[i]:
+            pred[j].append(i)
+
+    vertices = array('q')
+    offsets = array('q', [0])
+    on_path = [False] * n
+    dist = [K] * n
+    for s in range(n):
+        # distance from every vertex v > s back to s, restricted to vertices > s
+        # and to the K-1 arcs that can still be used to close a cycle
+        reached = [s]
+        queue = deque([s])
+        dist[s] = 0
+        while queue:
+            v = queue.popleft()
+            if dist[v] == K - 1:
+                continue
+            for u in pred[v]:
+                if u > s and dist[u] == K:
+                    dist[u] = dist[v] + 1
+                    reached.append(u)
+                    queue.append(u)
+
+        path = [s]
+        stack = [iter(succ[s])]
+        on_path[s] = True
+        while stack:
+            for w in stack[-1]:
+                if w == s:
+                    if len(path) > 1:
+                        vertices.extend(path)
+                        offsets.append(len(vertices))
+                elif w > s and not on_path[w] and len(path) + dist[w] <= K:
+                    path.append(w)
+                    on_path[w] = True
+                    stack.append(iter(succ[w]))
+                    break
+            else:
+                stack.pop()
+                on_path[path.pop()] = False
+
+        for v in reached:
+            dist[v] = K
+
+    vertices = np.frombuffer(vertices, dtype=np.int64) if len(vertices) else np.zeros(0, dtype=np.int64)
+    if labels != list(range(n)):
+        vertices = np.asarray(labels, dtype=np.int64)[vertices]
+    return CycleSet(vertices, np.frombuffer(offsets, dtype=np.int64))
+
+
+# INPUT
+# succ - successors of every vertex; a dictionary of iterables
+# pred - predecessors of every vertex; a dictionary of iterables
+# v - vertex
+# K - maximum size for cycles length
+# OUTPUT
+# list of the cycles of length 2..K through v, each one a tuple beginning with its smallest vertex
+def cycles_through(succ, pred, v, K):
+    # distance from every vertex back to v, within the K-1 arcs that can close a cycle
+    dist = {v: 0}
+    queue = deque([v])
+    while queue:
+        u = queue.popleft()
+        if dist[u] == K - 1:
+            continue
+        for w in pred[u]:
+            if w not in dist:
+                dist[w] = dist[u] + 1
+                queue.append(w)
+
+    cycles = []
+    path = [v]
+    on_path = {v}
+    stack = [iter(succ[v])]
+    while stack:
+        for w in stack[-1]:
+            if w == v:
+                if len(path) > 1:
+                    k = path.index(min(path))
+                    cycles.append(tuple(path[k:] + path[:k]))
+            elif w not in on_path and w in dist and len(path) + dist[w] <= K:
+                path.append(w)
+                on_path.add(w)
+                stack.append(iter(succ[w]))
+                break
+        else:
+            stack.pop()
+            on_path.discard(path.pop())
+    return cycles
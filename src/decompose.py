@@ -0,0 +1,138 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Decomposition of the KEP into independent subproblems.
+
+A cycle lies inside a strongly connected component (SCC) of the compatibility
+graph, so the components do not interact, except through the chains: a chain
+starts from an altruistic donor and may cross several components. The vertices
+within L arcs of an altruistic donor form the chain region, which is merged
+with every SCC it touches into a single subproblem; the other nontrivial SCCs
+are subproblems of their own, and the vertices of the trivial SCCs outside the
+region can never be matched.
+
+The subproblems are solved in parallel worker processes. The optimal value is
+the sum of their values and the optimal solutions are the products of their
+optimal solutions, which can be written as a factored pool (see pool_io).
+"""
+from kep_model import altruist_distances
+from parallel import run_tasks
+
+
+# INPUT
+# G - incidence list; a dictionary
+# OUTPUT
+# list of the SCCs of G, each one a sorted list of vertices (Tarjan's algorithm, without recursion)
+def strongly_connected_components(G):
+    vertices = sorted(set(G.keys()).union(j for i in G for j in G[i]))
+    index, low = {}, {}
+    stack, on_stack = [], set()
+    components = []
+    for root in vertices:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(G.get(root, [])))]
+        while work:
+            v, successors = work[-1]
+            for w in successors:
+                if w not in index:
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    on_stack.add(w)
+                    work.append((w, iter(G.get(w, []))))
+                    break
+                elif w in on_stack:
+                    low[v] = min(low[v], index[w])
+            else:
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(sorted(component))
+    return components
+
+
+# INPUT
+# G - incidence list; a dictionary
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# OUTPUT
+# list of the subproblems (vertices, altruistic nodes among them), the one with the chains first
+def decompose(G, L=0, altruistic_list=[]):
+    region = set()
+    if len(altruistic_list) > 0:
+        # as in kep_model.chain_positions, the altruistic donors give at position 1 even when L = 0
+        region = set(altruist_distances(G, set(altruistic_list), max(L, 1)))
+    chain_part = set(region)
+    parts = []
+    for component in strongly_connected_components(G):
+        if region.intersection(component):
+            chain_part.update(component)
+        elif len(component) > 1:
+            parts.append(component)
+    if chain_part:
+        parts.insert(0, sorted(chain_part))
+    altruistic = set(altruistic_list)
+    return [(part, [v for v in part if v in altruistic]) for part in parts]
+
+
+def subgraph(G, vertices):
+    # incidence list of G restricted to the vertices
+    keep = set(vertices)
+    return {v: [u for u in G.get(v, []) if u in keep] for v in vertices}
+
+
+def _solve_part(task, backend):
+    # imported here so that the decomposition can be computed without gurobipy
+    from kep_mip import solve_KEP
+    from budget import PoolMonitor
+    G, K, L, altruistic_list, formulation, budget, telemetry, interval, label = task
+    monitor = PoolMonitor(budget, telemetry, interval, label)
+    obj, runtime, _, _, _, solutions, complete = solve_KEP(G, K, L, altruistic_list, formulation,
+            env=backend.env, monitor=monitor)
+    pool = list(solutions)
+    monitor.done(complete, len(pool))
+    return obj or 0, runtime, pool, complete
+
+
+# INPUT
+# G - incidence list; a dictionary
+# K - maximum size for cycles length
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# formulation - 'cycle' or 'pief', see pief.build_formulation
+# workers - number of worker processes
+# threads - number of Gurobi threads of each worker (None: 1 with several workers, the default of Gurobi otherwise)
+# budget - budget.Budget of every subproblem (None for no budget)
+# telemetry - JSONL file where the progress of every subproblem is appended (None for no telemetry)
+# telemetry_interval - seconds between two progress records
+# label - name of the run in the telemetry, the subproblems are label#k
+# OUTPUT
+# Optimal value
+# list of (vertices, optimal value, runtime, number of solutions) of the subproblems
+# list of the pools of the subproblems, whose products are the optimal solutions (see pool_io.product_solutions)
+# True if the pools of all the subproblems are complete
+def solve_decomposed(G, K, L=0, altruistic_list=[], formulation='cycle', workers=1, threads=None,
+        budget=None, telemetry=None, telemetry_interval=1.0, label=''):
+    parts = decompose(G, L, altruistic_list)
+    tasks = [(subgraph(G, vertices), K, L, altruists, formulation, budget, telemetry, telemetry_interval, '%s#%d' % (label, k))
+            for k, (vertices, altruists) in enumerate(parts)]
+    # the largest subproblems are sent first
+    order = sorted(range(len(tasks)), key=lambda k: -len(parts[k][0]))
+    results = [None] * len(tasks)
+    for k, result in zip(order, run_tasks(_solve_part, [tasks[k] for k in order], workers, threads)):
+        results[k] = result
+    stats = [(vertices, obj, runtime, len(pool)) for (vertices, _), (obj, runtime, pool, _) in zip(parts, results)]
+    pools = [pool for _, _, pool, _ in results]
+    return sum(obj for obj, _, _, _ in results), stats, pools, all(complete for _, _, _, complete in results)
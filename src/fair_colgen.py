@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Column generation for the fair distributions over the optimal KEP solutions.
+
+Instead of enumerating every optimal solution and solving the fairness LP over
+the whole pool, a restricted master LP is solved over a small working set of
+solutions. New solutions are priced with the cycle formulation of kep_mip,
+restricted to its optimal face and weighted by the duals of the patient rows of
+the master. The patients of a solution are the ones in its cycles, as in the
+pools written by kep_mip.
+"""
+import time, argparse
+
+import numpy as np
+from gurobipy import Model, GRB, Column, LinExpr, quicksum
+
+from cycles import get_all_cycles
+from kep_model import build_KEP_model, extract_pool, vertex_labels, cycle_incidence
+from pool_io import save_to_file
+
+TOL = 1e-6
+
+
+# INPUT
+# G - incidence list; a dictionary
+# K - maximum size for cycles length
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# OUTPUT
+# pricing model restricted to the optimal face, variables X, cycles, vertex x cycle incidence
+def optimal_face_model(G, K, L=0, altruistic_list=[]):
+    Cycles_k = get_all_cycles(G,K)
+    m = Model("KEP pricing")
+    m.params.OutputFlag = 0
+    X, Z = build_KEP_model(m, G, Cycles_k, L, altruistic_list)
+    m.ModelSense = -1 # maximize
+    m.optimize()
+    # only optimal solutions can be priced (the number of transplants is integer)
+    m.addConstr(m.getObjective() >= round(m.ObjVal))
+    m.update()
+    return m, X, Z, Cycles_k, cycle_incidence(Cycles_k, vertex_labels(G))
+
+
+class MaxminMaster(object):
+    """
+    max y s.t. sum_s lambda_s = 1 and sum_{s ni p} lambda_s >= y for every patient p
+    """
+    sense = GRB.MAXIMIZE
+    coef = 1.0
+
+    def __init__(self, patients):
+        self.model = Model('maximin_fair_master')
+        self.model.params.OutputFlag = 0
+        y = self.model.addVar(lb=0.0, ub=1.0, obj=1.0)
+        self.convexity = self.model.addLConstr(LinExpr(), GRB.EQUAL, 1.0)
+        self.rows = {p: self.model.addLConstr(-y, GRB.GREATER_EQUAL, 0.0) for p in patients}
+        self.model.ModelSense = self.sense
+
+
+class L1Master(object):
+    """
+    min sum_p |q_p - m| s.t. q_p = sum_{s ni p} lambda_s, sum_p q_p = n m, sum_s lambda_s = 1
+    """
+    sense = GRB.MINIMIZE
+    coef = -1.0
+
+    def __init__(self, patients):
+        self.model = Model('l1_fair_master')
+        self.model.params.OutputFlag = 0
+        patients = list(patients)
+        m = self.model.addVar(lb=0.0, ub=1.0)
+        q = {p: self.model.addVar(lb=0.0, ub=1.0) for p in patients}
+        d = {p: self.model.addVar(lb=0.0, ub=1.0, obj=1.0) for p in patients}
+        self.convexity = self.model.addLConstr(LinExpr(), GRB.EQUAL, 1.0)
+        self.rows = {p: self.model.addLConstr(q[p], GRB.EQUAL, 0.0) for p in patients}
+        self.model.addConstr(quicksum(q.values()) == len(patients) * m)
+        for p in patients:
+            self.model.addConstr(d[p] >= q[p] - m)
+            self.model.addConstr(d[p] >= m - q[p])
+        self.model.ModelSense = self.sense
+
+
+MASTERS = {'maxmin': MaxminMaster, 'l1': L1Master}
+
+
+def _add_column(master, solution):
+    rows = [master.rows[p] for p in solution if p in master.rows]
+    column = Column([1.0] + [master.coef] * len(rows), [master.convexity] + rows)
+    return master.model.addVar(lb=0.0, ub=1.0, column=column)
+
+
+# INPUT
+# G - incidence list; a dictionary
+# K - maximum size for cycles length
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# num_patients - number of patients
+# loss - 'maxmin' or 'l1'
+# max_iterations - maximum number of pricing rounds
+# OUTPUT
+# solutions - the working set of solutions, each one a list of patients
+# solution_prob_dict - probability of each solution of the working set
+def fair_colgen_solution(G, K, L=0, altruistic_list=[], num_patients=None, loss='maxmin', max_iterations=1000):
+    m, X, Z, Cycles_k, A_cycles = optimal_face_model(G, K, L, altruistic_list)
+    labels = vertex_labels(G)
+    # the labels may start at 1 (Canadian instances), so num_patients is only a lower bound
+    num_patients = max(num_patients or 0, int(labels.max()) + 1 if len(labels) > 0 else 0)
+    weights = np.zeros(num_patients)
+    xs = [X[i+1] for i in range(len(Cycles_k))]
+    zs = list(Z.values())
+
+    def price(sense):
+        m.setAttr("Obj", xs, (A_cycles.T @ weights[labels]).tolist())
+        # the patients of the chains are not in the solutions, so the chain arcs weigh nothing
+        if zs:
+            m.setAttr("Obj", zs, [0.0] * len(zs))
+        m.ModelSense = sense
+        m.optimize()
+        return [(weights[solution].sum(), solution) for solution in extract_pool(m, X, Cycles_k, progress=False)]
+
+    # initial working set: greedily cover every patient that some optimal solution matches
+    solutions = []
+    covered = set()
+    while True:
+        weights[:] = 1.0
+        weights[list(covered)] = 0.0
+        value, solution = max(price(GRB.MAXIMIZE), key=lambda item: item[0])
+        if value < 0.5 and len(solutions) > 0:
+            break
+        solutions.append(solution)
+        covered.update(solution)
+
+    master = MASTERS[loss](sorted(covered) if loss == 'maxmin' else range(num_patients))
+    keys = set()
+    columns = []
+    for solution in solutions:
+        keys.add(frozenset(solution))
+        columns.append(_add_column(master, solution))
+
+    for _ in range(max_iterations):
+        master.model.optimize()
+        mu = master.convexity.Pi
+        weights[:] = 0.0
+        for p, row in master.rows.items():
+            weights[p] = master.coef * row.Pi
+        # reduced cost of a solution s: -(mu + sum_{p in s} weights[p])
+        if master.sense == GRB.MAXIMIZE:
+            candidates = [(-(mu + value), solution) for value, solution in price(GRB.MINIMIZE)]
+        else:
+            candidates = [((mu + value), solution) for value, solution in price(GRB.MAXIMIZE)]
+        added = 0
+        for improvement, solution in candidates:
+            if improvement > TOL and frozenset(solution) not in keys:
+                keys.add(frozenset(solution))
+                solutions.append(solution)
+                columns.append(_add_column(master, solution))
+                added += 1
+        if added == 0:
+            break
+
+    if master.model.status != GRB.Status.OPTIMAL:
+        return solutions, {}
+    return solutions, {i: var.X for i, var in enumerate(columns)}
+
+
+if __name__ == "__main__":
+    from kep_io import read_kep
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename')
+    parser.add_argument('outfile', help="file where the working set of solutions is written")
+    parser.add_argument('--loss', choices=sorted(MASTERS.keys()), default='maxmin')
+    parser.add_argument('--cycle-limit', type=int, default=3)
+    parser.add_argument('--chain-limit', type=int, default=3)
+    parser.add_argument('--pool-format', choices=['text', 'binary'], default='text')
+    parser.add_argument('--prob-file', default=None, help="file where the probability of each solution is written")
+    args = parser.parse_args()
+
+    G, num_V, Nb_arcs, altruistic_list = read_kep(args.filename)
+
+    start_time = time.time()
+    sols, probs = fair_colgen_solution(G, args.cycle_limit, args.chain_limit, altruistic_list,
+            len(G), args.loss)
+
+    save_to_file(args.outfile, sols, args.pool_format == 'binary', len(G))
+    if args.prob_file is not None:
+        with open(args.prob_file, 'w') as f:
+            f.writelines('%g\n' % probs.get(i, 0.0) for i in range(len(sols)))
+
+    runtime = time.time() - start_time
+    print('runtime: %g'%runtime)
+    print('number of solutions %d'%len(sols))
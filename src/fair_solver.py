@@ -5,71 +5,253 @@
 
 
 from __future__ import print_function, division
-from gurobipy import Model, GRB, quicksum, LinExpr
+try:
+    # only needed by the *_old solvers, the others go through lp_backend
+    from gurobipy import Model, GRB, quicksum, LinExpr
+except ImportError:
+    pass
 import os, operator
-from random_solver import process_solutions
+import numpy as np
+import scipy.sparse as sp
+from instance_context import load_pool_data
+from presolve import reduce_pool
+from metrics import ProductDistribution, probability_vector
+from lp_backend import LinearProgram, GurobiBackend, EQUAL, GREATER_EQUAL, MINIMIZE, MAXIMIZE
 
 
 # In[2]:
 
 
-def fair_maxmin_solution(solutions, num_patients):
-    model = Model('maximin_fair')
-    model.params.outputflag = 0
-    solutions = process_solutions(solutions)
-    solution_size = len(solutions)
-    solution_dict = {}
+def pool_incidence(solutions, num_patients):
+    """
+    Patient x solution incidence matrix of the deduplicated pool. It only
+    depends on the pool, so it is loaded once and shared by the different losses.
+    :param solutions: String giving the filename of the pool, or an InstanceContext
+    :param num_patients: number of patients
+    :return: scipy.sparse.csr_matrix
+    """
+    data = load_pool_data(solutions, num_patients)
+    if data.factored:
+        # only the maxmin loss separates over the components, see factored_maxmin
+        raise ValueError("the incidence of a factored pool is only available per component")
+    return data.incidence
 
-    dict_array = []
-    solution_vars = []
-    for i in range(solution_size):
-        p = model.addVar(lb=0, ub=1, vtype=GRB.CONTINUOUS)
-        solution_dict[i] = p
-        solution_vars.append(p)
-    solution_exprt = quicksum(solution_vars)
-    model.addConstr(solution_exprt, GRB.EQUAL, 1.0)
-    
-    node_prob_dict = {}
-    for i in range(solution_size):
-        for item in solutions[i]:
-            if int(item) in node_prob_dict.keys():
-                node_prob_dict[int(item)].append(i)
-            else:
-                node_prob_dict[int(item)]=[i]
-        
-    y = model.addVar(lb=0, ub=1.0, vtype=GRB.CONTINUOUS)
-    
-    for key, value in node_prob_dict.items():
-        tmp = []
-        for solution in value:
-            tmp.append(solution_dict[solution])
-        expr = quicksum(tmp) 
-        #expr_constant = float(len(value))
-        model.addConstr(expr, GRB.GREATER_EQUAL, y)
-        
-    
-    
-    model.update()
 
-    model.setObjective(y, GRB.MAXIMIZE)
-    
-    model.update()
+def _convexity(num_solutions, num_vars):
+    # the probabilities of the solutions (first variables) sum to 1
+    return sp.csr_matrix((np.ones(num_solutions), (np.zeros(num_solutions, dtype=int), np.arange(num_solutions))),
+            shape=(1, num_vars))
 
-    try:
-        model.optimize()
-    except e:
-        print(e)
-        
-    if (model.status == GRB.Status.OPTIMAL):
-        solution_prob_dict = {}   
-        for key,value in solution_dict.items():
-            solution_prob_dict[key] = value.x
-        
-        
-        return solution_prob_dict
+
+def _distribution(result, num_solutions):
+    # the probabilities of the solutions are the first variables of every LP
+    if result is None:
+        return {}
+    return {i: p for i, p in enumerate(result[0][:num_solutions].tolist())}
+
+
+def _default_backend(backend):
+    return backend if backend is not None else GurobiBackend()
+
+
+def maxmin_lp(A):
+    """
+    max y s.t. every patient in some solution is selected with probability >= y
+    :param A: patient x solution incidence matrix
+    :return: LinearProgram whose first variables are the probabilities of the solutions
+    """
+    num_patients, num_solutions = A.shape
+    covered = A[np.diff(A.indptr) > 0]
+    # variables: [solution probabilities, y]
+    lp = LinearProgram(np.concatenate([np.zeros(num_solutions), [1.0]]), sense=MAXIMIZE)
+    lp.add_rows(_convexity(num_solutions, num_solutions + 1), EQUAL, 1.0)
+    y = sp.csr_matrix(-np.ones((covered.shape[0], 1)))
+    lp.add_rows(sp.hstack([covered, y]), GREATER_EQUAL, 0.0)
+    return lp
+
+
+def _mean_lp(A, num_uncovered=0):
+    # variables: [solution probabilities, patient probabilities, mean, distances to the mean]
+    # the num_uncovered patients left out of A have probability 0, at distance m from the mean
+    num_patients, num_solutions = A.shape
+    n = num_solutions + 2 * num_patients + 1
+    lp = LinearProgram(np.concatenate([np.zeros(num_solutions + num_patients), [num_uncovered], np.ones(num_patients)]), sense=MINIMIZE)
+    lp.add_rows(_convexity(num_solutions, n), EQUAL, 1.0)
+    I = sp.identity(num_patients, format='csr')
+    ones = sp.csr_matrix(np.ones((num_patients, 1)))
+    # patient probabilities
+    lp.add_rows(sp.hstack([-A, I, sp.csr_matrix((num_patients, 1)), sp.csr_matrix((num_patients, num_patients))]), EQUAL, 0.0)
+    # mean of the patient probabilities
+    mean = sp.hstack([sp.csr_matrix((1, num_solutions)), sp.csr_matrix(np.ones((1, num_patients))),
+            sp.csr_matrix([[-(num_patients + num_uncovered)]]), sp.csr_matrix((1, num_patients))])
+    lp.add_rows(mean, EQUAL, 0.0)
+    return lp, I, ones
+
+
+def l1_lp(A, num_uncovered=0):
+    """
+    min sum_i |p_i - m| where p_i is the probability of patient i and m their mean
+    :param A: patient x solution incidence matrix
+    :param num_uncovered: number of patients of no solution, not in A
+    :return: LinearProgram whose first variables are the probabilities of the solutions
+    """
+    num_patients, num_solutions = A.shape
+    lp, I, ones = _mean_lp(A, num_uncovered)
+    S = sp.csr_matrix((num_patients, num_solutions))
+    lp.add_rows(sp.hstack([S, -I, ones, I]), GREATER_EQUAL, 0.0)
+    lp.add_rows(sp.hstack([S, I, -ones, I]), GREATER_EQUAL, 0.0)
+    return lp
+
+
+# losses that are linear programs, solved by any backend
+LOSSES = {'maxmin': maxmin_lp, 'l1': l1_lp}
+
+
+def l2_qp(A, num_uncovered=0):
+    """
+    min sum_i (p_i - m)^2 where p_i is the probability of patient i and m their mean,
+    as a convex QP: d_i = p_i - m are free variables and the objective is sum_i d_i^2
+    :param A: patient x solution incidence matrix
+    :param num_uncovered: number of patients of no solution, not in A; each adds m^2
+    :return: LinearProgram (with a quadratic objective) whose first variables are the probabilities of the solutions
+    """
+    num_patients, num_solutions = A.shape
+    # variables: [solution probabilities, distances to the mean, mean]
+    n = num_solutions + num_patients + 1
+    lb = np.concatenate([np.zeros(num_solutions), -np.ones(num_patients), [0.0]])
+    q = np.concatenate([np.zeros(num_solutions), np.ones(num_patients), [num_uncovered]])
+    lp = LinearProgram(np.zeros(n), lb=lb, ub=1.0, sense=MINIMIZE, q=q)
+    lp.add_rows(_convexity(num_solutions, n), EQUAL, 1.0)
+    # d_i - p_i + m = 0
+    lp.add_rows(sp.hstack([-A, sp.identity(num_patients, format='csr'), sp.csr_matrix(np.ones((num_patients, 1)))]), EQUAL, 0.0)
+    # m is the mean of the patient probabilities
+    mean = sp.hstack([sp.csr_matrix(A.sum(axis=0)), sp.csr_matrix((1, num_patients)), sp.csr_matrix([[-(num_patients + num_uncovered)]])])
+    lp.add_rows(mean, EQUAL, 0.0)
+    return lp
+
+
+def presolved_lp(A, loss):
+    """
+    :param A: patient x solution incidence matrix
+    :param loss: 'maxmin', 'l1' or 'l2'
+    :return: LinearProgram of the presolved pool, and the Presolved mapping its solution back to A
+    """
+    reduced = reduce_pool(A, loss)
+    if loss == 'maxmin':
+        lp = maxmin_lp(reduced.A)
+    elif loss == 'l1':
+        lp = l1_lp(reduced.A, reduced.num_uncovered)
     else:
+        lp = l2_qp(reduced.A, reduced.num_uncovered)
+    return lp, reduced
+
+
+def _solve_loss(A, loss, backend, presolve=True, stats=None, name=''):
+    # stats, if a dictionary, receives the numbers of columns and rows removed by the presolve
+    if not presolve:
+        lp = {'maxmin': maxmin_lp, 'l1': l1_lp, 'l2': l2_qp}[loss](A)
+        return _distribution(_default_backend(backend).solve_lp(lp, name), A.shape[1])
+    lp, reduced = presolved_lp(A, loss)
+    if stats is not None:
+        stats.update(reduced.stats)
+    result = _default_backend(backend).solve_lp(lp, name)
+    if result is None:
         return {}
-    
+    return _distribution((reduced.expand(result[0]), result[1]), A.shape[1])
+
+
+def _project_simplex(v):
+    # euclidean projection on {x >= 0, sum x = 1}, by sorting
+    u = np.sort(v)[::-1]
+    css = np.cumsum(u) - 1.0
+    k = np.nonzero(u * np.arange(1, len(v) + 1) > css)[0][-1]
+    return np.maximum(v - css[k] / (k + 1), 0.0)
+
+
+def l2_gradient(A, tol=1e-6, max_iter=10000):
+    """
+    min sum_i (p_i - m)^2 over the probability distributions of the solutions, by
+    accelerated projected gradient (FISTA with backtracking). Only the incidence
+    matrix and vectors of the size of its sides are stored.
+    :param A: patient x solution incidence matrix
+    :param tol: stop when the Frank-Wolfe gap, an upper bound on the distance to the optimal value, is below tol
+    :param max_iter: maximum number of iterations
+    :return: probability of each solution and the gap reached
+    """
+    num_patients, num_solutions = A.shape
+    A = sp.csr_matrix(A, dtype=np.float64)
+    AT = A.T.tocsr()
+
+    def centered(x):
+        p = A @ x
+        return p - p.mean()
+
+    def value_and_gradient(x):
+        d = centered(x)
+        return d @ d, 2.0 * (AT @ d)
+
+    # initial Lipschitz constant of the gradient, 2 ||CA||^2, by a few power iterations
+    v = np.ones(num_solutions) / np.sqrt(num_solutions)
+    L = 1e-12
+    for _ in range(20):
+        w = AT @ centered(v)
+        norm = np.linalg.norm(w)
+        if norm == 0:
+            break
+        L = max(L, 2.0 * norm)
+        v = w / norm
+
+    x = np.full(num_solutions, 1.0 / num_solutions)
+    y, t = x, 1.0
+    g_x = value_and_gradient(x)[1]
+    gap = g_x @ x - g_x.min()
+    for _ in range(max_iter):
+        if gap <= tol:
+            break
+        f_y, g_y = value_and_gradient(y)
+        while True:
+            z = _project_simplex(y - g_y / L)
+            f_z, g_z = value_and_gradient(z)
+            step = z - y
+            if f_z <= f_y + g_y @ step + 0.5 * L * (step @ step) + 1e-15:
+                break
+            L *= 2.0
+        t_next = (1.0 + np.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        y = z + (t - 1.0) / t_next * (z - x)
+        x, g_x, t = z, g_z, t_next
+        gap = g_x @ x - g_x.min()
+    return x, gap
+
+
+def factored_maxmin(incidences, backend=None, presolve=True, stats=None):
+    """
+    Maxmin distribution over a factored pool. The probability of a patient only
+    depends on the distribution over the solutions of its component, so the
+    product of the maxmin distributions of the components is optimal, with the
+    smallest of their values.
+    :param incidences: incidence matrices of the components, see instance_context.FactoredPoolData
+    :return: metrics.ProductDistribution, {} if a component is not solved
+    """
+    factors = []
+    for A in incidences:
+        component_stats = {}
+        probs = _solve_loss(A, 'maxmin', backend, presolve, component_stats, 'maximin_fair')
+        if len(probs) == 0:
+            return {}
+        if stats is not None:
+            for key, value in component_stats.items():
+                stats[key] = stats.get(key, 0) + value
+        factors.append(probability_vector(probs, A.shape[1]))
+    return ProductDistribution(factors)
+
+
+def fair_maxmin_solution(solutions, num_patients, backend=None, presolve=True, stats=None):
+    data = load_pool_data(solutions, num_patients)
+    # a factored pool is solved component by component, and gives a ProductDistribution
+    if data.factored:
+        return factored_maxmin(data.incidence, backend, presolve, stats)
+    A = data.incidence
+    return _solve_loss(A, 'maxmin', backend, presolve, stats, 'maximin_fair')
 
 
 # In[3]:
@@ -97,108 +279,24 @@ def fix_solution(solutions):
 # In[4]:
 
 
-def fair_l1_solution(old_solutions, num_patients):
-
-    solutions = process_solutions(old_solutions)
-    num_solutions = len(solutions)
-
-    
-    patient_to_solutions = [[] for _ in range(num_patients)]
-    for s, solution in enumerate(solutions):
-        for p in solution:
-            patient_to_solutions[p].append(s)
-
-
-    model = Model()
-    model.params.OutputFlag = 0
-
-
-    solution_probs = [model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS) for _ in range(num_solutions)]
-    model.addConstr(quicksum(solution_probs), GRB.EQUAL, 1.0)
-
-    patient_probs = [model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS) for _ in range(num_patients)]
-
-    for i in range(num_patients):
-        expr = quicksum(solution_probs[j] for j in patient_to_solutions[i])
-        model.addConstr(patient_probs[i], GRB.EQUAL, expr)
-
-    m = model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS)
-    model.addConstr(quicksum(patient_probs), GRB.EQUAL, num_patients * m)
-
-    distance_to_mean = [model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS) for _ in range(num_patients)]
-    for i in range(num_patients):
-        model.addConstr(distance_to_mean[i], GRB.GREATER_EQUAL, patient_probs[i] - m)
-        model.addConstr(distance_to_mean[i], GRB.GREATER_EQUAL, m - patient_probs[i])
-
-    model.setObjective(quicksum(distance_to_mean), GRB.MINIMIZE)
-    model.optimize()
-
-    #return [solution_probs[i].x for i in range(num_solutions)]
-    
-    if (model.status == GRB.Status.OPTIMAL):
-        solution_prob_dict = {}   
-        for i in range(num_solutions):
-            solution_prob_dict[i] = solution_probs[i].x
-        
-        
-        return solution_prob_dict
-    else:
-        return {}
-   
-    
+def fair_l1_solution(solutions, num_patients, backend=None, presolve=True, stats=None):
+    A = pool_incidence(solutions, num_patients)
+    return _solve_loss(A, 'l1', backend, presolve, stats)
 
 
 # In[5]:
 
 
-def fair_l2_solution(solutions, num_patients):
-    
-    solutions = process_solutions(solutions)
-    num_solutions = len(solutions)
-
-    patient_to_solutions = [[] for _ in range(num_patients)]
-    for s, solution in enumerate(solutions):
-        for p in solution:
-            patient_to_solutions[p].append(s)
-
-
-    model = Model()
-    model.params.OutputFlag = 0
-
-
-    solution_probs = [model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS) for _ in range(num_solutions)]
-    model.addConstr(quicksum(solution_probs), GRB.EQUAL, 1.0)
-
-    patient_probs = [model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS) for _ in range(num_patients)]
-
-    for i in range(num_patients):
-        expr = quicksum(solution_probs[j] for j in patient_to_solutions[i])
-        model.addConstr(patient_probs[i], GRB.EQUAL, expr)
-
-    m = model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS)
-    model.addConstr(quicksum(patient_probs), GRB.EQUAL, num_patients * m)
+def fair_l2_solution(solutions, num_patients, backend=None, presolve=True, stats=None):
+    A = pool_incidence(solutions, num_patients)
+    return _solve_loss(A, 'l2', backend, presolve, stats)
 
-    distance_to_mean = [model.addVar(lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS) for _ in range(num_patients)]
-    for i in range(num_patients):
-        model.addConstr(distance_to_mean[i], GRB.GREATER_EQUAL, (patient_probs[i] - m)*(patient_probs[i] - m))
-        #model.addConstr(distance_to_mean[i], GRB.GREATER_EQUAL, m - patient_probs[i])
 
-    model.params.QCPDual = 0
-    model.setObjective(quicksum(distance_to_mean), GRB.MINIMIZE)
-    model.optimize()
-
-    return [solution_probs[i].x for i in range(num_solutions)]
-    
-    if (model.status == GRB.Status.OPTIMAL):
-        solution_prob_dict = {}   
-        for i in range(num_solutions):
-            solution_prob_dict[i] = value.x
-        
-        
-        return solution_prob_dict
-    else:
-        return {}
-   
+def fair_l2_gradient_solution(solutions, num_patients, backend=None, presolve=True, tol=1e-6, max_iter=10000):
+    # first-order solver of the l2 loss, in NumPy: the backend and presolve are not used
+    A = pool_incidence(solutions, num_patients)
+    x, _ = l2_gradient(A, tol, max_iter)
+    return _distribution((x, None), A.shape[1])
 
 
 # In[6]:
@@ -0,0 +1,168 @@
+"""
+Python 3
+Data of an instance loaded once and shared by all the methods and losses of an
+experiment: the PRA of the patients, the deduplicated pool of solutions and its
+patient x solution incidence matrix. A factored pool (see pool_io) is kept
+factored: every component is deduplicated with its own incidence matrix, and
+the products of their solutions are never built.
+
+The parsed files are kept in an LRU cache bounded by the total number of bytes
+of the cached arrays, keyed by path and modification time so that a file that
+changes on disk is parsed again.
+"""
+import os
+from collections import OrderedDict
+
+from random_solver import process_solutions
+from pool_io import FactoredPool, is_factored_pool, pool_files, incidence_matrix, dedup_pool
+from kep_io import read_pra
+
+
+class PoolData(object):
+    """
+    Deduplicated pool, with the multiplicity of every patient set and the
+    patient x solution incidence matrix.
+    """
+    factored = False
+
+    def __init__(self, solutions, counts, incidence):
+        self.solutions = solutions
+        self.counts = counts
+        self.incidence = incidence
+
+    @property
+    def nbytes(self):
+        A = self.incidence
+        # the solutions take about as much memory as the indices of the incidence
+        return A.data.nbytes + 2 * A.indices.nbytes + A.indptr.nbytes + self.counts.nbytes + 64 * len(self.solutions)
+
+
+class FactoredPoolData(object):
+    """
+    PoolData of every component of a factored pool. The incidence matrices of
+    the components have the same rows, and the solutions of the flat pool are
+    the products of the solutions of the components.
+    """
+    factored = True
+
+    def __init__(self, pool, num_patients):
+        """
+        :param pool: pool_io.FactoredPool
+        :param num_patients: number of patients
+        """
+        self.components = []
+        for component, A in zip(pool.components, pool.incidences(num_patients)):
+            # the products of deduplicated components are distinct, as the components share no patient
+            first, counts = dedup_pool(component, A.shape[0])
+            self.components.append(PoolData([component[i] for i in first], counts, A[:, first].tocsr()))
+
+    @property
+    def sizes(self):
+        return [len(data.solutions) for data in self.components]
+
+    @property
+    def incidence(self):
+        # incidence matrices of the components, see metrics.patient_marginals
+        return [data.incidence for data in self.components]
+
+    @property
+    def solutions(self):
+        raise ValueError("the solutions of a factored pool are not materialized, use its components")
+
+    @property
+    def nbytes(self):
+        return sum(data.nbytes for data in self.components)
+
+
+def read_pool_data(solution_file, num_patients):
+    """
+    :param solution_file: String giving the filename of a pool (the directory of a factored pool)
+    :param num_patients: number of patients
+    :return: PoolData, or FactoredPoolData for a factored pool
+    """
+    if is_factored_pool(solution_file):
+        return FactoredPoolData(FactoredPool(solution_file), num_patients)
+    solutions, counts = process_solutions(solution_file, return_counts=True)
+    return PoolData(solutions, counts, incidence_matrix(solutions, num_patients))
+
+
+class ContextCache(object):
+    """
+    LRU cache of parsed files bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes=1 << 30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, kind, filename, num_patients):
+        # a factored pool changes with its manifest and component files
+        mtime = max(os.path.getmtime(f) for f in pool_files(filename)) if kind == 'pool' else os.path.getmtime(filename)
+        key = (kind, os.path.abspath(filename), mtime, num_patients)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        if kind == 'pra':
+            value = read_pra(filename, num_patients)
+            nbytes = value.nbytes
+        else:
+            value = read_pool_data(filename, num_patients)
+            nbytes = value.nbytes
+        self.entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        # the entry just loaded is kept even if it is larger than the bound
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+
+_cache = ContextCache()
+
+
+def set_cache_size(max_bytes):
+    """
+    :param max_bytes: maximum total size of the cached instances
+    """
+    _cache.max_bytes = max_bytes
+
+
+class InstanceContext(object):
+    """
+    PRA vector and pool of an instance, loaded through the cache.
+    """
+
+    def __init__(self, graph_file, solution_file, num_patients):
+        self.graph_file = graph_file
+        self.solution_file = solution_file
+        self.num_patients = num_patients
+        self.pra = _cache.get('pra', graph_file, num_patients)
+        self.pool = _cache.get('pool', solution_file, num_patients)
+
+    @property
+    def solutions(self):
+        return self.pool.solutions
+
+    @property
+    def counts(self):
+        return self.pool.counts
+
+    @property
+    def incidence(self):
+        return self.pool.incidence
+
+
+def load_pool_data(solutions, num_patients):
+    """
+    :param solutions: String giving the filename of a pool, or an InstanceContext
+    :param num_patients: number of patients
+    :return: the PoolData (FactoredPoolData) of the pool
+    """
+    if isinstance(solutions, InstanceContext):
+        return solutions.pool
+    return _cache.get('pool', solutions, num_patients)
@@ -0,0 +1,217 @@
+"""
+Python 3
+Loader of the KEP instances and of their type-information files.
+
+A graph file is parsed in bulk into a CSR graph (successors of every vertex in
+the order of the file) with a mask of the altruistic donors, and a
+type-information file into NumPy columns (pair, blood types of the patient and
+of the donor, wife flag, PRA). The compiled arrays are cached next to the
+source, as their raw bytes after a one-line JSON header, so that a warm load is
+a single read. The cache is used when the size and mtime of the source are
+unchanged, or when its sha256 is (after a checkout that only touched the
+mtime).
+
+Graph file ('standard' kep format, whitespace separated):
+    num_V num_E
+    v1 v2 w          (num_E arcs, the weights are ignored)
+    num_altruistic   (or a sentinel line such as "-1 -1 -1" for none)
+    a                (num_altruistic lines)
+The Porto instances label the vertices from 0 and the Canadian ones from 1;
+the labels are kept, so the graph has max(num_V, largest label + 1) vertices.
+"""
+import os, json, hashlib
+
+import numpy as np
+
+CACHE_SUFFIX = '.kepcache'
+CACHE_VERSION = 2
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_cache(cache_file):
+    # a JSON header line with the stamp, the digest and the dtype and shape of
+    # every array, then their raw bytes: no zip or .npy header to parse
+    with open(cache_file, 'rb') as f:
+        content = f.read()
+    end = content.index(b'\n')
+    header = json.loads(content[:end])
+    arrays = {}
+    offset = end + 1
+    for name, dtype, shape in header['arrays']:
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(content, dtype, count, offset).reshape(shape)
+        offset += count * dtype.itemsize
+    return header, arrays
+
+
+def _load_cached(filename, parse):
+    # parse(data) returns a dictionary of arrays, cached next to filename
+    cache_file = filename + CACHE_SUFFIX
+    stat = os.stat(filename)
+    stamp = [CACHE_VERSION, stat.st_mtime_ns, stat.st_size]
+    data = None
+    try:
+        header, arrays = _read_cache(cache_file)
+        if header['stamp'] == stamp:
+            return arrays
+        # the digest is only computed when the stamp differs
+        with open(filename, 'rb') as f:
+            data = f.read()
+        if header['stamp'][0] == CACHE_VERSION and header['digest'] == _digest(data):
+            _store(cache_file, arrays, stamp, header['digest'])
+            return arrays
+    except (OSError, KeyError, ValueError, TypeError):
+        pass
+    if data is None:
+        with open(filename, 'rb') as f:
+            data = f.read()
+    arrays = parse(data)
+    _store(cache_file, arrays, stamp, _digest(data))
+    return arrays
+
+
+def _store(cache_file, arrays, stamp, digest):
+    # the cache is an optimization: a read-only directory only disables it
+    tmp = cache_file + '.%d.tmp' % os.getpid()
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    header = {'stamp': stamp, 'digest': digest,
+            'arrays': [[name, array.dtype.str, list(array.shape)] for name, array in arrays.items()]}
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(header).encode() + b'\n')
+            for array in arrays.values():
+                f.write(array.tobytes())
+        os.replace(tmp, cache_file)
+    except OSError:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _parse_graph(data):
+    lines = data.decode().splitlines()
+    num_V, num_E = map(int, lines[0].split())
+    arcs = np.array(' '.join(lines[1:1+num_E]).split(), dtype=np.int64).reshape(num_E, 3)
+    rest = [line.split() for line in lines[1+num_E:] if line.strip()]
+    # a count on its own line, anything else (the "-1 -1 -1" sentinel) means no altruist
+    num_altruistic = int(rest[0][0]) if len(rest) > 0 and len(rest[0]) == 1 else 0
+    altruistic = np.array([int(line[0]) for line in rest[1:1+max(num_altruistic, 0)]], dtype=np.int64)
+
+    tail, head = arcs[:, 0], arcs[:, 1]
+    n = max(num_V, int(arcs[:, :2].max()) + 1 if num_E > 0 else 0,
+            int(altruistic.max()) + 1 if len(altruistic) > 0 else 0)
+    order = np.argsort(tail, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tail, minlength=n), out=indptr[1:])
+    # a single array keeps the header of the cache short
+    return {'graph': np.concatenate([[num_V, num_E, n], indptr, head[order], altruistic])}
+
+
+class KEPGraph(object):
+    """
+    Directed graph of an instance in CSR form: the successors of vertex v are
+    indices[indptr[v]:indptr[v+1]].
+    """
+
+    def __init__(self, arrays):
+        packed = arrays['graph']
+        self.num_V, self.num_E, n = packed[:3].tolist()
+        self.indptr = packed[3:n+4]
+        self.indices = packed[n+4:n+4+self.num_E]
+        self.altruistic = packed[n+4+self.num_E:]
+        self.is_altruistic = np.zeros(n, dtype=bool)
+        self.is_altruistic[self.altruistic] = True
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def adjacency(self):
+        """
+        :return: incidence list; a dictionary from every vertex to the list of its successors
+        """
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        return {v: indices[indptr[v]:indptr[v+1]] for v in range(len(self))}
+
+
+def load_graph(filename):
+    """
+    :param filename: graph file of the instance
+    :return: KEPGraph
+    """
+    return KEPGraph(_load_cached(filename, _parse_graph))
+
+
+# READ INSTANCE
+# INPUT
+# filename - it is a string
+# OUTPUT
+# G - it is a incidence list; a dictionary
+# num_V - number of nodes
+# Nb_arcs - number of arcs
+# altruistic_list - list of altruistic nodes
+def read_kep(filename):
+    graph = load_graph(filename)
+    return graph.adjacency(), graph.num_V, graph.num_E, graph.altruistic.tolist()
+
+
+TYPE_COLUMNS = ['PAIR', 'PATIENT', 'DONOR', 'WIFE-P?', '%PRA']
+
+
+def _parse_types(data):
+    lines = [line.split('\t') for line in data.decode().splitlines() if line.strip()]
+    head = [name.strip() for name in lines[0]]
+    # the rows may have less columns than the header, never less than the ones kept
+    width = max(head.index(name) for name in TYPE_COLUMNS) + 1
+    cells = np.array([[cell.strip() for cell in line[:width]] for line in lines[1:]], dtype=str).reshape(-1, width)
+    column = lambda name: cells[:, head.index(name)]
+    return {'ints': np.array([column('PAIR'), column('WIFE-P?')], dtype=np.int64).reshape(2, -1),
+            'pra': column('%PRA').astype(np.float64),
+            'blood_types': np.array([column('PATIENT'), column('DONOR')], dtype=str).reshape(2, -1)}
+
+
+class TypeInfo(object):
+    """
+    Columns of a type-information file, one row per line of the file.
+    """
+
+    def __init__(self, arrays):
+        self.pair, self.wife = arrays['ints']
+        self.patient, self.donor = arrays['blood_types']
+        self.pra = arrays['pra']
+
+    def __len__(self):
+        return len(self.pair)
+
+
+def load_types(filename):
+    """
+    :param filename: type-information file of the instance
+    :return: TypeInfo
+    """
+    return TypeInfo(_load_cached(filename, _parse_types))
+
+
+def read_pra(filename, num_patients=None):
+    """
+    :param filename: type-information file of the instance
+    :param num_patients: number of patients (the first rows of the file), None for every row
+    :return: array with the PRA of each patient
+    """
+    pra = load_types(filename).pra
+    return pra if num_patients is None else pra[:num_patients]
+
+
+def hard_to_match(filename, threshold=0.8, num_patients=None):
+    """
+    :param filename: type-information file of the instance
+    :param threshold: minimum PRA of a hard-to-match patient
+    :param num_patients: number of patients (the first rows of the file), None for every row
+    :return: sorted list of the PAIR labels of the hard-to-match patients
+    """
+    types = load_types(filename)
+    rows = slice(None) if num_patients is None else slice(num_patients)
+    return np.unique(types.pair[rows][types.pra[rows] >= threshold]).tolist()
@@ -1,6 +1,12 @@
 #!/usr/bin/env python
 
 import sys, time, argparse
+from cycles import get_all_cycles
+from kep_model import build_KEP_model, extract_pool
+from pool_io import save_to_file
+from kep_io import read_kep, read_pra
+import profiling
+from profiling import add_profile_arguments, profile_from_args, write_profile
 
 """
 Python 3
@@ -8,86 +14,6 @@ REQUIREMENTS: GUROBI
 This code determines a solution that maximizes the number of transplants given a directed graph
 where cycles of length at most K are allowed and chains of length at most L are allowed.
 """
-# READ INSTANCE
-# INPUT
-# filename - it is a string
-# OUTPUT
-# G - it is a incidence list; a dictionary
-# num_V - number of nodes
-# Nb_arcs - number of arcs
-# altruistic_list - list of altruistic nodes
-def read_kep(filename):
-    #read file in the 'standard' kep format
-    f = open(filename)
-    num_V, num_E = map(int,f.readline().split()) # number of nodes, number of edges
-    # nodes are labeled from 0 to n
-    G = {i:[] for i in range(num_V)}
-    Nb_arcs = 0
-    for _ in range(num_E):
-        v1, v2, w = map(int,f.readline().split()) # there is an arc v1 to v2; ARC's weights are being ignored (i.e., they are 1)
-        G[v1].append(v2)
-        Nb_arcs = Nb_arcs +1
-    num_Altruistic = int(eval(f.readline())) # number of altruistic donors
-    altruistic_list = []
-    for _ in range(num_Altruistic):
-        altruistic_list.append(int(eval(f.readline())))
-    f.close()
-    return G, num_V, Nb_arcs, altruistic_list
-
-def read_pra(filename):
-    f = open(filename)
-    head = f.readline().split('\t')
-    col = head.index('%PRA')
-    pra_list = []
-
-    for idx, line in enumerate(f):
-        pra = float(line.strip('\n').split('\t')[col])
-        pra_list.append(pra)
-
-    f.close()
-
-    return pra_list
-
-
-# Compute all the cycles c of length less or equal to K and save the respective length wc
-# make cycles to start in the node with smallest label
-def normalize(cycle):
-    cmin = min(cycle)
-    while cycle[0] != cmin:
-        v = cycle.pop(0)
-        cycle.append(v)
-
-def all_cycles(cycles, path, node, tovisit, adj,K):
-    global spc
-    for i in adj[node]:
-        if i in path:
-            j = path.index(i)
-            cycle = path[j:]+[node]
-            normalize(cycle)
-            cycles.add(tuple(cycle))
-        if i in tovisit:
-            if K-1 > 0:
-                all_cycles(cycles,path+[node],i,tovisit-set([i]),adj,K-1)
-    # spc = spc[:-4]
-    return cycles
-
-
-# INPUT
-# adj - incidence list; a dictionary
-# K - maximumsize for cycles length
-# OUTPUT
-# cycles - set of tuples of size K
-def get_all_cycles(adj,K):
-    tovisit = set(adj.keys())
-    visited = set([])
-    cycles = set([])
-    for i in tovisit:
-        tmpvisit = set(tovisit)
-        tmpvisit.remove(i)
-        first = i
-        all_cycles(cycles,[],first,tmpvisit,adj,K)
-    return cycles
-
 # Input
 # cycles - List of cycles
 # adj - incidence list; a dictionary
@@ -111,93 +37,139 @@ def get_back_arcs(cycles, adj):
 
 
 from gurobipy import *
+
+HARD_TO_MATCH = 0.8
+
+
+class Tier(object):
+    """
+    Level of the hierarchy: the criterion maximized at this level and the
+    expression that keeps its value in the following levels.
+    """
+
+    def __init__(self, name, objective, lock=None, tolerance=0.0):
+        """
+        :param name: name of the tier in the reports
+        :param objective: function of a Hierarchy returning the LinExpr to maximize
+        :param lock: function of a Hierarchy returning the LinExpr kept >= optimum - tolerance (default: objective)
+        :param tolerance: absolute degradation of the optimum allowed in the following tiers
+        """
+        self.name = name
+        self.objective = objective
+        self.lock = lock if lock is not None else objective
+        self.tolerance = tolerance
+
+
+class Hierarchy(object):
+    """
+    Data available to the criteria of the tiers.
+    """
+
+    def __init__(self, G, Cycles_k, X, Z, pra_list):
+        self.G = G
+        self.Cycles_k = Cycles_k
+        self.X = X
+        self.Z = Z
+        self.pra_list = pra_list
+        self.xs = [X[i+1] for i in range(len(Cycles_k))]
+
+    def cycle_expr(self, coefs):
+        return LinExpr(list(map(float, coefs)), self.xs)
+
+
+def cycle_transplants(h):
+    return h.cycle_expr(h.Cycles_k.lengths())
+
+def transplants(h):
+    return cycle_transplants(h) + quicksum(h.Z.values())
+
+def num_cycles(h):
+    return h.cycle_expr([1.0] * len(h.Cycles_k))
+
+def back_arcs(h):
+    return h.cycle_expr(get_back_arcs(h.Cycles_k, h.G))
+
+def hard_to_match(h):
+    return h.cycle_expr([sum(1.0 for v in c if h.pra_list[v] >= HARD_TO_MATCH) for c in h.Cycles_k])
+
+
+CRITERIA = {'transplants': transplants, 'cycle_transplants': cycle_transplants, 'cycles': num_cycles,
+        'back_arcs': back_arcs, 'hard_to_match': hard_to_match}
+
+# the transplants in cycles may be 3 below the optimum, chains included
+TIERS = [Tier('transplants', transplants, cycle_transplants, 3.0),
+        Tier('cycles', num_cycles),
+        Tier('back_arcs', back_arcs),
+        Tier('hard_to_match', hard_to_match)]
+
+
+# INPUT
+# spec - comma separated names of CRITERIA, each one optionally followed by :tolerance
+# OUTPUT
+# list of tiers
+def parse_tiers(spec):
+    defaults = {tier.name: tier for tier in TIERS}
+    tiers = []
+    for item in spec.split(','):
+        name, _, tolerance = item.strip().partition(':')
+        if name not in CRITERIA:
+            raise ValueError("unknown criterion %s" % name)
+        default = defaults.get(name, Tier(name, CRITERIA[name]))
+        tiers.append(Tier(name, default.objective, default.lock,
+                float(tolerance) if tolerance else default.tolerance))
+    return tiers
+
+
 # INPUT
 # G - incidence list; a dictionary
 # K - maximum size for cycles length
 # L - maximum length of chain size for cycles length
 # altruistic_list - list of altruistic nodes
+# pra_list - PRA of each patient
+# tiers - list of Tier, maximized in order; the pool is enumerated on the last one
 # OUTPUT
 # Optimal value
-# running time (seconds)
+# running time (seconds), summed over the tiers
 # model
 # variables X
 # variables Z
-def solve_KEP(G,K,L=0,altruistic_list=[], pra_list=[]):
+# solutions
+# stats - name, objective value, runtime and node count of each tier
+def solve_KEP(G,K,L=0,altruistic_list=[], pra_list=[], tiers=TIERS):
     setParam("OutputFlag", 0)
     # compute all cycles of length at most 3
-    Cycles_k = list(get_all_cycles(G,K))
-    # find the # of back-arcs for each 3-cycle
-    back_arcs = get_back_arcs(Cycles_k, G)
+    with profiling.stage('cycles'):
+        Cycles_k = get_all_cycles(G,K)
     # create model
     m = Model("Deterministic KEP")
-    # create the variables associated with cycles
-    X = {i+1: m.addVar(obj = len(c), vtype="B",name="X"+str(i+1)) for i,c in enumerate(Cycles_k)}
-    m.update()
-    # to understand the dictionary below see how chains can be considered in "Position-Indexed Formulations for Kidney Exchange"
-    K_dic = {(i,j):[1] if i in altruistic_list else range(2,L+1) for i in G.keys() for j in G[i]}
-    # create variables for chains
-    Z = {(i,j,l): m.addVar(obj = 1, vtype="B",name="z"+str(i)+"_"+str(j)+"_"+str(l)) for i,j in K_dic.keys() for l in K_dic[(i,j)]}
-    m.update()
-    for v in G.keys():
-        # WRONG constraint each vertex donates at most one kidney: not enough for correctness!
-        #m.addConstr(quicksum(X[i+1]  for i,c in enumerate(Cycles_k) if v in c)+quicksum(Z[(v,j,l)] for j in G[v] for l in K_dic[(v,j)])<= 1)
-        # each vertex receives at most one kidney: correct!
-        m.addConstr(quicksum(X[i+1]  for i,c in enumerate(Cycles_k) if v in c)+quicksum(Z[(j,v,l)] for j in G.keys() if v in G[j] for l in K_dic[(j,v)])<= 1)
-        m.update()
-        if v not in altruistic_list:
-            for l in range(1,L):
-                m.addConstr(quicksum(Z[(j,v,l)] for j in G.keys() if v in G[j] and l in K_dic[(j,v)])>= quicksum(Z[(v,j,l+1)] for j in G[v]))
-                m.update()
-        else:
-            m.addConstr(quicksum(Z[(v,j,1)] for j in G[v])<= 1)
-            m.update()
-    m.ModelSense = -1 # maximize
-    m.update()
-    m.optimize()
-    # add constraints to maximize # of cycles
-    m.addConstr(quicksum([len(c) * X[i+1] for i,c in enumerate(Cycles_k)]) >= m.ObjVal - 3.0)
-    m.setObjective(quicksum([X[i+1] for i,c in enumerate(Cycles_k)]))
-    m.ModelSense = -1 # maximize
-    m.update()
-    m.optimize()
-    # add constraints to max the # of back-arcs
-    m.addConstr(quicksum([X[i+1] for i,c in enumerate(Cycles_k)]) >= m.ObjVal)
-    m.setObjective(quicksum([back_arcs[i] * X[i+1] for i,c in enumerate(Cycles_k)]))
-    m.ModelSense = -1 # maximize
-    m.update()
-    m.optimize()
-    m.addConstr(quicksum([back_arcs[i] * X[i+1] for i,c in enumerate(Cycles_k)]) >= m.ObjVal)
-    m.setObjective(quicksum([sum(map(lambda x: 1 if pra_list[x] >= 0.8 else 0.0, c)) * X[i+1] for i,c in enumerate(Cycles_k)]))
-    m.update()
-    m.setParam("PoolSolutions", 2000000000)
-    m.setParam("PoolSearchMode", 2)
-    m.setParam("PoolGap", 0)
-    m.reset(clearall=0.5)
-    m.optimize()
+    # create the variables associated with cycles and chains, and the constraints
+    with profiling.stage('build'):
+        X, Z = build_KEP_model(m, G, Cycles_k, L, altruistic_list)
+        h = Hierarchy(G, Cycles_k, X, Z, pra_list)
+    variables = m.getVars()
+    stats = []
+    runtime = 0.0
+    for k, tier in enumerate(tiers):
+        m.setObjective(tier.objective(h), GRB.MAXIMIZE)
+        if k == len(tiers) - 1:
+            m.setParam("PoolSolutions", 2000000000)
+            m.setParam("PoolSearchMode", 2)
+            m.setParam("PoolGap", 0)
+        profiling.optimize(m, 'tier %s' % tier.name)
+        runtime += m.Runtime
+        stats.append({'tier': tier.name, 'objective': m.ObjVal, 'runtime': m.Runtime, 'nodes': m.NodeCount})
+        if k < len(tiers) - 1:
+            # the incumbent is the MIP start of the next tier (ignored if it violates the lock)
+            start = m.getAttr("X", variables)
+            m.addConstr(tier.lock(h) >= m.ObjVal - tier.tolerance)
+            m.setAttr("Start", variables, start)
     #print("\n###############################################")
     #print("# Optimal solution for KEP #")
     #print("###############################################")
-    solutions = []
-    for i in range(m.SolCount):
-        print(i)
-        m.setParam("SolutionNumber", i)
-        sol = m.Xn
-        solutions.append([item for idx,c in enumerate(Cycles_k) for item in c if sol[idx] > 0.5]) 
-        # solutions.append(m.Xn[:len(Cycles_k)])
-
-    return m.ObjVal,m.Runtime, m, X, Z, solutions
-
+    # the pool is extracted lazily, while it is written to file
+    solutions = extract_pool(m, X, Cycles_k)
 
-def save_to_file(filename, solutions):
-    """
-    Method to save solutions to file
-    :param filename: String giving the filename
-    :param solutions: The list of solutions to save to file
-    """
-    with open(filename, 'w') as f:
-        lines = [list(map(str, solution)) for solution in solutions]
-        lines = [" ".join(line) + "\n" for line in lines]
-        f.writelines(lines)
+    return m.ObjVal, runtime, m, X, Z, solutions, stats
 
 
 if __name__ == "__main__":
@@ -208,18 +180,28 @@ if __name__ == "__main__":
     parser.add_argument('outfile')
     parser.add_argument('--cycle-limit', type=int, default=3)
     parser.add_argument('--chain-limit', type=int, default=3)
+    parser.add_argument('--pool-format', choices=['text', 'binary'], default='text')
+    parser.add_argument('--tiers', default=','.join(tier.name for tier in TIERS),
+            help="criteria maximized in order, each one optionally followed by :tolerance (%s)" % ', '.join(sorted(CRITERIA)))
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    profile_from_args(args)
 
-    G, num_V, Nb_arcs, altruistic_list = read_kep(args.filename)
-    pra_list = read_pra(args.prafile)
+    with profiling.stage('parse'):
+        G, num_V, Nb_arcs, altruistic_list = read_kep(args.filename)
+        pra_list = read_pra(args.prafile)
 
     start_time = time.time()
-    obj, _, _, _, _, sols = solve_KEP(G, args.cycle_limit,
-            args.chain_limit, altruistic_list, pra_list)
+    obj, _, _, _, _, sols, stats = solve_KEP(G, args.cycle_limit,
+            args.chain_limit, altruistic_list, pra_list, parse_tiers(args.tiers))
+    for tier in stats:
+        print('tier %(tier)s: objective %(objective)g, runtime %(runtime)g, nodes %(nodes)d' % tier)
 
-    save_to_file(args.outfile, sols)
+    with profiling.stage('write'):
+        num_sols = save_to_file(args.outfile, sols, args.pool_format == 'binary', len(G))
     
     runtime = time.time() - start_time    
     print('runtime: %g'%runtime)
-    print('number of solutions %d'%len(sols))
+    print('number of solutions %d'%num_sols)
+    write_profile(args)
 
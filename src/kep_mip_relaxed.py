@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 
 import sys, time, argparse
+from kep_model import extract_pool
+from pief import build_formulation, FORMULATIONS
+from pool_io import save_to_file
+from kep_io import read_kep
+from budget import PoolMonitor, add_budget_arguments, monitor_from_args
+import profiling
+from profiling import add_profile_arguments, profile_from_args, write_profile
 
 
 """
@@ -9,142 +16,51 @@ REQUIREMENTS: GUROBI
 This code determines a solution that maximizes the number of transplants given a directed graph
 where cycles of length at most K are allowed and chains of length at most L are allowed.
 """
-# READ INSTANCE
-# INPUT
-# filename - it is a string
-# OUTPUT
-# G - it is a incidence list; a dictionary
-# num_V - number of nodes
-# Nb_arcs - number of arcs
-# altruistic_list - list of altruistic nodes
-def read_kep(filename):
-    #read file in the 'standard' kep format
-    f = open(filename)
-    num_V, num_E = map(int,f.readline().split()) # number of nodes, number of edges
-    # nodes are labeled from 0 to n
-    G = {i:[] for i in range(num_V)}
-    Nb_arcs = 0
-    for _ in range(num_E):
-        v1, v2, w = map(int,f.readline().split()) # there is an arc v1 to v2; ARC's weights are being ignored (i.e., they are 1)
-        G[v1].append(v2)
-        Nb_arcs = Nb_arcs +1
-    num_Altruistic = int(eval(f.readline())) # number of altruistic donors
-    altruistic_list = []
-    for _ in range(num_Altruistic):
-        altruistic_list.append(int(eval(f.readline())))
-    return G, num_V, Nb_arcs, altruistic_list
-
-
-# Compute all the cycles c of length less or equal to K and save the respective length wc
-# make cycles to start in the node with smallest label
-def normalize(cycle):
-    cmin = min(cycle)
-    while cycle[0] != cmin:
-        v = cycle.pop(0)
-        cycle.append(v)
-
-def all_cycles(cycles, path, node, tovisit, adj,K):
-    global spc
-    for i in adj[node]:
-        if i in path:
-            j = path.index(i)
-            cycle = path[j:]+[node]
-            normalize(cycle)
-            cycles.add(tuple(cycle))
-        if i in tovisit:
-            if K-1 > 0:
-                all_cycles(cycles,path+[node],i,tovisit-set([i]),adj,K-1)
-    # spc = spc[:-4]
-    return cycles
-
-
-# INPUT
-# adj - incidence list; a dictionary
-# K - maximumsize for cycles length
-# OUTPUT
-# cycles - set of tuples of size K
-def get_all_cycles(adj,K):
-    tovisit = set(adj.keys())
-    visited = set([])
-    cycles = set([])
-    for i in tovisit:
-        tmpvisit = set(tovisit)
-        tmpvisit.remove(i)
-        first = i
-        all_cycles(cycles,[],first,tmpvisit,adj,K)
-    return cycles
-
 from gurobipy import *
 # INPUT
 # G - incidence list; a dictionary
 # K - maximum size for cycles length
 # L - maximum length of chain size for cycles length
 # altruistic_list - list of altruistic nodes
+# formulation - 'cycle' or 'pief', see pief.build_formulation
+# monitor - budget.PoolMonitor enforcing the budgets of the run (None for no budget)
 # OUTPUT
-# Optimal value
+# Optimal value (best known value if the run was stopped, None if no solution was found)
 # running time (seconds)
 # model
 # variables X
 # variables Z
-def solve_KEP(G,K,L=0,altruistic_list=[]):
+# solutions
+# True if the pool is complete, False if a budget stopped the run
+def solve_KEP(G,K,L=0,altruistic_list=[], formulation='cycle', monitor=None):
     setParam("OutputFlag", 0)
-    # compute all cycles of length at most 3
-    Cycles_k = list(get_all_cycles(G,K))
+    if monitor is None:
+        monitor = PoolMonitor()
     # create model
     m = Model("Deterministic KEP")
-    # create the variables associated with cycles
-    X = {i+1: m.addVar(obj = len(c), vtype="B",name="X"+str(i+1)) for i,c in enumerate(Cycles_k)}
-    m.update()
-    # to understand the dictionary below see how chains can be considered in "Position-Indexed Formulations for Kidney Exchange"
-    K_dic = {(i,j):[1] if i in altruistic_list else range(2,L+1) for i in G.keys() for j in G[i]}
-    # create variables for chains
-    Z = {(i,j,l): m.addVar(obj = 1, vtype="B",name="z"+str(i)+"_"+str(j)+"_"+str(l)) for i,j in K_dic.keys() for l in K_dic[(i,j)]}
-    m.update()
-    for v in G.keys():
-        # WRONG constraint each vertex donates at most one kidney: not enough for correctness!
-        #m.addConstr(quicksum(X[i+1]  for i,c in enumerate(Cycles_k) if v in c)+quicksum(Z[(v,j,l)] for j in G[v] for l in K_dic[(v,j)])<= 1)
-        # each vertex receives at most one kidney: correct!
-        m.addConstr(quicksum(X[i+1]  for i,c in enumerate(Cycles_k) if v in c)+quicksum(Z[(j,v,l)] for j in G.keys() if v in G[j] for l in K_dic[(j,v)])<= 1)
-        m.update()
-        if v not in altruistic_list:
-            for l in range(1,L):
-                m.addConstr(quicksum(Z[(j,v,l)] for j in G.keys() if v in G[j] and l in K_dic[(j,v)])>= quicksum(Z[(v,j,l+1)] for j in G[v]))
-                m.update()
-        else:
-            m.addConstr(quicksum(Z[(v,j,1)] for j in G[v])<= 1)
-            m.update()
+    # create the variables associated with cycles (or their arcs) and chains, and the constraints
+    X, Z, Cycles_k = build_formulation(m, G, K, L, altruistic_list, formulation)
     m.ModelSense = -1 # maximize
     m.update()
-    m.optimize()
-    m.setParam("PoolSolutions", 2000000000)
-    m.setParam("PoolSearchMode", 2)
-    m.setParam("PoolGap", 3.0 / m.objVal)
-    m.reset(clearall=0)
-    m.optimize()
+    complete = monitor.optimize(m, 'optimize')
+    if m.SolCount == 0:
+        return None, m.Runtime, m, X, Z, iter([]), False
+    best = m.ObjVal
+    if complete:
+        m.setParam("PoolSolutions", 2000000000)
+        m.setParam("PoolSearchMode", 2)
+        m.setParam("PoolGap", 3.0 / m.objVal)
+        m.reset(clearall=0)
+        complete = monitor.optimize(m, 'pool')
     #print("\n###############################################")
     #print("# Optimal solution for KEP #")
     #print("###############################################")
-    solutions = []
-    for i in range(m.SolCount):
-        print(i)
-        m.setParam("SolutionNumber", i)
-        sol = m.Xn
-        solutions.append([item for idx,c in enumerate(Cycles_k) for item in c if sol[idx] > 0.5]) 
-        # solutions.append(m.Xn[:len(Cycles_k)])
-
-    return m.ObjVal,m.Runtime, m, X, Z, solutions
-
+    # the pool is extracted lazily, while it is written to file; a partial pool
+    # may hold solutions more than 3 transplants away from the optimum
+    solutions = extract_pool(m, X, Cycles_k, min_objective=None if complete else best - 3 - 1e-6,
+            max_solutions=monitor.max_solutions)
 
-def save_to_file(filename, solutions):
-    """
-    Method to save solutions to file
-    :param filename: String giving the filename
-    :param solutions: The list of solutions to save to file
-    """
-    with open(filename, 'w') as f:
-        lines = [list(map(str, solution)) for solution in solutions]
-        lines = [" ".join(line) + "\n" for line in lines]
-        f.writelines(lines)
+    return best,m.Runtime, m, X, Z, solutions, complete
 
 
 if __name__ == "__main__":
@@ -154,17 +70,31 @@ if __name__ == "__main__":
     parser.add_argument('outfile')
     parser.add_argument('--cycle-limit', type=int, default=3)
     parser.add_argument('--chain-limit', type=int, default=3)
+    parser.add_argument('--pool-format', choices=['text', 'binary'], default='text')
+    parser.add_argument('--cycle-formulation', choices=FORMULATIONS, default='cycle',
+            help="one variable per cycle, or per arc and position (pief)")
+    add_budget_arguments(parser)
+    add_profile_arguments(parser)
     args = parser.parse_args()
+    profile_from_args(args)
 
-    G, num_V, Nb_arcs, altruistic_list = read_kep(args.filename)
+    with profiling.stage('parse'):
+        G, num_V, Nb_arcs, altruistic_list = read_kep(args.filename)
 
     start_time = time.time()
-    obj, _, _, _, _, sols = solve_KEP(G, args.cycle_limit,
-            args.chain_limit, altruistic_list)
+    monitor = monitor_from_args(args, args.filename)
+    obj, _, _, _, _, sols, complete = solve_KEP(G, args.cycle_limit,
+            args.chain_limit, altruistic_list, args.cycle_formulation, monitor)
 
-    save_to_file(args.outfile, sols)
+    with profiling.stage('write'):
+        num_sols = save_to_file(args.outfile, sols, args.pool_format == 'binary', len(G))
     
     runtime = time.time() - start_time    
     print('runtime: %g'%runtime)
-    print('number of solutions %d'%len(sols))
+    print('number of solutions %d'%num_sols)
+    print('complete: %s' % complete)
+    monitor.done(complete, num_sols)
+    write_profile(args)
+    if not complete:
+        sys.exit(2)
 
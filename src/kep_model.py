@@ -0,0 +1,243 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI, SCIPY
+Construction of the cycle and position-indexed chain formulation of the KEP.
+
+The vertex-cycle incidence and the arcs of the chain variables are computed once
+as sparse matrices, and every family of constraints is added with a single call
+to the matrix API of Gurobi instead of one quicksum per vertex.
+"""
+import sys, time
+from collections import deque
+
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+import profiling
+
+
+# INPUT
+# G - incidence list; a dictionary
+# OUTPUT
+# labels - sorted array with the vertices of G
+def vertex_labels(G):
+    return np.array(sorted(G.keys()), dtype=np.int64)
+
+
+def _rows(labels, vertices):
+    # position of each vertex in labels
+    if len(labels) > 0 and labels[0] == 0 and labels[-1] == len(labels) - 1:
+        return np.asarray(vertices, dtype=np.int64)
+    return np.searchsorted(labels, vertices)
+
+
+# INPUT
+# Cycles_k - CycleSet with the cycles
+# labels - sorted array with the vertices of the graph
+# OUTPUT
+# vertex x cycle incidence matrix (scipy.sparse.csr_matrix)
+def cycle_incidence(Cycles_k, labels):
+    n_cycles = len(Cycles_k)
+    indices = _rows(labels, Cycles_k.vertices)
+    data = np.ones(len(indices), dtype=np.float64)
+    # the cycle x vertex matrix is already in CSR form
+    A = sp.csr_matrix((data, indices, Cycles_k.offsets), shape=(n_cycles, len(labels)))
+    return A.T.tocsr()
+
+
+# INPUT
+# G - incidence list; a dictionary
+# altruistic - set of altruistic nodes
+# depth - maximum distance of interest
+# OUTPUT
+# dist - number of arcs of a shortest path from an altruistic node to each node
+#        reached within depth arcs, without going through another altruistic node
+def altruist_distances(G, altruistic, depth):
+    dist = {a: 0 for a in altruistic}
+    queue = deque(altruistic)
+    while queue:
+        v = queue.popleft()
+        if dist[v] == depth:
+            continue
+        for u in G.get(v, []):
+            if u not in dist:
+                dist[u] = dist[v] + 1
+                queue.append(u)
+    return dist
+
+
+# INPUT
+# G - incidence list; a dictionary
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# OUTPUT
+# K_dic - positions in a chain at which each arc (i,j) can be used
+def chain_positions(G, L, altruistic_list):
+    # to understand the dictionary below see how chains can be considered in "Position-Indexed Formulations for Kidney Exchange"
+    altruistic = set(altruistic_list)
+    # arc (i,j) can only be the l-th arc of a chain if an altruistic donor reaches i in l-1 arcs
+    dist = altruist_distances(G, altruistic, L - 1)
+    K_dic = {}
+    for i in G.keys():
+        if i in altruistic:
+            positions = [1]
+        elif i in dist:
+            positions = range(max(dist[i] + 1, 2), L+1)
+        else:
+            continue
+        for j in G[i]:
+            K_dic[(i,j)] = positions
+    return K_dic
+
+
+# INPUT
+# G - incidence list; a dictionary
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# labels - sorted array with the vertices of G
+# OUTPUT
+# Z_keys - list of (i,j,l) triples, one per chain variable
+# A_in - vertex x chain variable matrix of the arcs entering each vertex
+# A_flow - flow conservation matrix for the non-altruistic vertices (>= 0)
+# A_alt - matrix of the arcs leaving each altruistic donor at position 1 (<= 1)
+def chain_matrices(G, L, altruistic_list, labels):
+    K_dic = chain_positions(G, L, altruistic_list)
+    Z_keys = [(i,j,l) for i,j in K_dic.keys() for l in K_dic[(i,j)]]
+    n_V = len(labels)
+    if len(Z_keys) > 0:
+        zi, zj, zl = np.array(Z_keys, dtype=np.int64).T
+    else:
+        zi = zj = zl = np.zeros(0, dtype=np.int64)
+    ri, rj = _rows(labels, zi), _rows(labels, zj)
+    cols = np.arange(len(Z_keys))
+    ones = np.ones(len(Z_keys))
+    A_in = sp.csr_matrix((ones, (rj, cols)), shape=(n_V, len(Z_keys)))
+
+    is_altruistic = np.zeros(n_V, dtype=bool)
+    if len(altruistic_list) > 0:
+        is_altruistic[_rows(labels, np.array(list(set(altruistic_list)), dtype=np.int64))] = True
+    # row (v,l) of the flow constraints: arcs entering v at position l minus arcs leaving v at position l+1
+    width = max(L - 1, 1)
+    enter = ~is_altruistic[rj] & (zl < L)
+    leave = ~is_altruistic[ri] & (zl >= 2)
+    flow_rows = np.concatenate([rj[enter] * width + zl[enter] - 1, ri[leave] * width + zl[leave] - 2])
+    flow_cols = np.concatenate([cols[enter], cols[leave]])
+    flow_data = np.concatenate([ones[enter], -ones[leave]])
+    used, flow_rows = np.unique(flow_rows, return_inverse=True)
+    A_flow = sp.csr_matrix((flow_data, (flow_rows, flow_cols)), shape=(len(used), len(Z_keys)))
+
+    first = is_altruistic[ri] & (zl == 1)
+    used, alt_rows = np.unique(ri[first], return_inverse=True)
+    A_alt = sp.csr_matrix((ones[first], (alt_rows, cols[first])), shape=(len(used), len(Z_keys)))
+    return Z_keys, A_in, A_flow, A_alt
+
+
+# INPUT
+# m - gurobi model
+# G - incidence list; a dictionary
+# Cycles_k - CycleSet with the cycles of length at most K
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# cycle_obj - objective coefficient of each cycle (default: its length)
+# cycle_rows - matrix of additional constraints on the cycle variables (== 0), None if there is none
+# OUTPUT
+# variables X - dictionary from i+1 to the variable of cycle i
+# variables Z - dictionary from (i,j,l) to the variable of arc (i,j) at position l of a chain
+def build_KEP_model(m, G, Cycles_k, L=0, altruistic_list=[], cycle_obj=None, cycle_rows=None):
+    labels = vertex_labels(G)
+    A_cycles = cycle_incidence(Cycles_k, labels)
+    Z_keys, A_in, A_flow, A_alt = chain_matrices(G, L, altruistic_list, labels)
+    if cycle_obj is None:
+        cycle_obj = Cycles_k.lengths()
+    n_cycles = len(Cycles_k)
+
+    # a single block of variables: the cycles followed by the chain arcs
+    names = ["X"+str(i+1) for i in range(n_cycles)] + ["z"+str(i)+"_"+str(j)+"_"+str(l) for i,j,l in Z_keys]
+    obj = np.concatenate([np.asarray(cycle_obj, dtype=np.float64), np.ones(len(Z_keys))])
+    XZ = m.addMVar(n_cycles + len(Z_keys), vtype=GRB.BINARY, obj=obj, name=names)
+
+    # each vertex receives at most one kidney
+    m.addMConstr(sp.hstack([A_cycles, A_in]).tocsr(), XZ, GRB.LESS_EQUAL, np.ones(len(labels)))
+    if A_flow.shape[0] > 0:
+        empty = sp.csr_matrix((A_flow.shape[0], n_cycles))
+        m.addMConstr(sp.hstack([empty, A_flow]).tocsr(), XZ, GRB.GREATER_EQUAL, np.zeros(A_flow.shape[0]))
+    if A_alt.shape[0] > 0:
+        empty = sp.csr_matrix((A_alt.shape[0], n_cycles))
+        m.addMConstr(sp.hstack([empty, A_alt]).tocsr(), XZ, GRB.LESS_EQUAL, np.ones(A_alt.shape[0]))
+    if cycle_rows is not None and cycle_rows.shape[0] > 0:
+        empty = sp.csr_matrix((cycle_rows.shape[0], len(Z_keys)))
+        m.addMConstr(sp.hstack([cycle_rows, empty]).tocsr(), XZ, GRB.EQUAL, np.zeros(cycle_rows.shape[0]))
+    m.update()
+
+    variables = XZ.tolist()
+    X = {i+1: variables[i] for i in range(n_cycles)}
+    Z = {key: variables[n_cycles+k] for k,key in enumerate(Z_keys)}
+    return X, Z
+
+
+class ProgressCounter(object):
+    """
+    Counter that reports its value on stderr at most once every interval seconds.
+    """
+
+    def __init__(self, label, total=None, interval=5.0, stream=sys.stderr):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.stream = stream
+        self.count = 0
+        self.start = time.time()
+        self.last = self.start
+
+    def update(self, n=1):
+        self.count += n
+        now = time.time()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.report()
+
+    def report(self):
+        elapsed = time.time() - self.start
+        total = '/%d' % self.total if self.total is not None else ''
+        self.stream.write('%s: %d%s (%.1fs)\n' % (self.label, self.count, total, elapsed))
+        self.stream.flush()
+
+
+# INPUT
+# m - gurobi model after the pool search
+# X - dictionary of the cycle variables, as returned by build_KEP_model
+# Cycles_k - CycleSet with the cycles
+# batch_size - number of solutions converted to patient lists at once
+# progress - report the number of extracted solutions on stderr
+# min_objective - only keep the solutions of objective at least min_objective (for a pool cut short)
+# max_solutions - only keep the first max_solutions solutions (for a pool truncated by budget.PoolMonitor)
+# OUTPUT
+# generator over the solutions of the pool, each one the list of patients in its cycles
+def extract_pool(m, X, Cycles_k, batch_size=1024, progress=True, min_objective=None, max_solutions=None):
+    xs = [X[i+1] for i in range(len(Cycles_k))]
+    lengths = Cycles_k.lengths()
+    # the pool is sorted by objective, so the first solutions are the best ones
+    num_solutions = m.SolCount if max_solutions is None else min(m.SolCount, max_solutions)
+    counter = ProgressCounter('pool extraction', num_solutions) if progress else None
+    for first in range(0, num_solutions, batch_size):
+        # only the slice of the cycle variables is pulled from the pool
+        with profiling.stage('extract'):
+            chosen = []
+            for i in range(first, min(first + batch_size, num_solutions)):
+                m.setParam("SolutionNumber", i)
+                if min_objective is not None and m.PoolObjVal < min_objective:
+                    continue
+                chosen.append(np.flatnonzero(np.array(m.getAttr("Xn", xs)) > 0.5))
+            if len(chosen) == 0:
+                continue
+            patients = Cycles_k.members(np.concatenate(chosen)).tolist()
+            ends = np.cumsum([lengths[idx].sum() for idx in chosen]).tolist()
+        start = 0
+        for end in ends:
+            yield patients[start:end]
+            start = end
+        if counter is not None:
+            counter.update(len(chosen))
+    if counter is not None and num_solutions > 0:
+        counter.report()
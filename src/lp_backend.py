@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+"""
+Python 3
+REQUIREMENTS: GUROBI or SCIPY (HiGHS)
+Solvers of the linear programs of the fair distributions.
+
+An LP is given as sparse blocks of rows, and is solved either by Gurobi, with
+the matrix API, or by HiGHS through scipy.optimize.linprog, which does not need
+a license. gurobipy is only imported by the Gurobi backend, so the HiGHS one
+works on machines without it.
+
+Benchmark of the two backends on pools:
+
+   python lp_backend.py pool [pool ...] [--loss maxmin l1] [--num-patients N] [--presolve]
+"""
+import time, argparse
+
+import numpy as np
+import scipy.sparse as sp
+
+# same values as GRB.LESS_EQUAL, GRB.GREATER_EQUAL, GRB.EQUAL, GRB.MINIMIZE and GRB.MAXIMIZE
+LESS_EQUAL = '<'
+GREATER_EQUAL = '>'
+EQUAL = '='
+MINIMIZE = 1
+MAXIMIZE = -1
+
+
+class LinearProgram(object):
+    """
+    min or max c x s.t. A_k x (<=, >= or =) b_k for every block k of rows, lb <= x <= ub
+    With q, the objective has the separable quadratic term sum_j q_j x_j^2 (a QP).
+    """
+
+    def __init__(self, c, lb=0.0, ub=1.0, sense=MINIMIZE, q=None):
+        self.c = np.asarray(c, dtype=np.float64)
+        self.q = None if q is None else np.asarray(q, dtype=np.float64)
+        self.lb = np.broadcast_to(np.asarray(lb, dtype=np.float64), self.c.shape)
+        self.ub = np.broadcast_to(np.asarray(ub, dtype=np.float64), self.c.shape)
+        self.sense = sense
+        self.rows = []
+
+    @property
+    def num_vars(self):
+        return len(self.c)
+
+    def add_rows(self, A, sense, rhs):
+        """
+        :param A: sparse matrix with num_vars columns
+        :param sense: LESS_EQUAL, GREATER_EQUAL or EQUAL
+        :param rhs: right-hand side, an array or a scalar
+        """
+        A = sp.csr_matrix(A)
+        if A.shape[0] > 0:
+            self.rows.append((A, sense, np.broadcast_to(np.asarray(rhs, dtype=np.float64), (A.shape[0],))))
+
+    def blocks(self, sense):
+        # rows of the given sense, stacked
+        rows = [(A, b) for A, s, b in self.rows if s == sense]
+        if len(rows) == 0:
+            return None, None
+        return sp.vstack([A for A, _ in rows]).tocsr(), np.concatenate([b for _, b in rows])
+
+
+class GurobiBackend(object):
+    """
+    Gurobi, in a given environment (the default one if None).
+    """
+    name = 'gurobi'
+
+    def __init__(self, env=None, threads=None):
+        from gurobipy import Env
+        if env is None and threads is not None:
+            env = Env(empty=True)
+            env.setParam('OutputFlag', 0)
+            env.setParam('Threads', threads)
+            env.start()
+        self.env = env
+
+    def model(self, lp, name=''):
+        """
+        :param lp: LinearProgram
+        :param name: name of the gurobi model
+        :return: the gurobi model of lp and the MVar of its variables
+        """
+        from gurobipy import Model, GRB
+        model = Model(name, env=self.env)
+        model.params.OutputFlag = 0
+        x = model.addMVar(lp.num_vars, lb=lp.lb, ub=lp.ub, vtype=GRB.CONTINUOUS, obj=lp.c)
+        model.ModelSense = lp.sense
+        for A, sense, rhs in lp.rows:
+            model.addMConstr(A, x, sense, rhs)
+        if lp.q is not None:
+            model.setMObjective(sp.diags(lp.q), lp.c, 0.0, x, x, x, lp.sense)
+        return model, x
+
+    def solve(self, model, x):
+        from gurobipy import GRB
+        model.optimize()
+        if model.status != GRB.Status.OPTIMAL:
+            return None
+        return x.X, model.ObjVal
+
+    def solve_lp(self, lp, name=''):
+        """
+        :param lp: LinearProgram
+        :return: optimal solution and value, None if the LP is not solved to optimality
+        """
+        return self.solve(*self.model(lp, name))
+
+
+class HighsBackend(object):
+    """
+    HiGHS, through scipy.optimize.linprog.
+    """
+    name = 'highs'
+
+    def __init__(self, env=None, threads=None):
+        # linprog does not expose the threads of HiGHS
+        pass
+
+    def solve_lp(self, lp, name=''):
+        from scipy.optimize import linprog
+        if lp.q is not None:
+            raise ValueError("linprog does not solve quadratic programs")
+        A_ub, b_ub = lp.blocks(LESS_EQUAL)
+        A_ge, b_ge = lp.blocks(GREATER_EQUAL)
+        if A_ge is not None:
+            A_ub = -A_ge if A_ub is None else sp.vstack([A_ub, -A_ge]).tocsr()
+            b_ub = -b_ge if b_ub is None else np.concatenate([b_ub, -b_ge])
+        A_eq, b_eq = lp.blocks(EQUAL)
+        # linprog minimizes
+        res = linprog(lp.sense * lp.c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq,
+                bounds=np.column_stack([lp.lb, lp.ub]), method='highs')
+        if res.status != 0:
+            return None
+        return res.x, lp.sense * res.fun
+
+
+BACKENDS = {'gurobi': GurobiBackend, 'highs': HighsBackend}
+
+
+def make_backend(name='gurobi', threads=None):
+    """
+    :param name: key of BACKENDS
+    :param threads: number of threads of the solver (None for its default)
+    :return: backend object
+    """
+    return BACKENDS[name](threads=threads)
+
+
+if __name__ == "__main__":
+    from fair_solver import LOSSES, pool_incidence, presolved_lp
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('pools', nargs='+')
+    parser.add_argument('--loss', nargs='+', choices=['maxmin', 'l1'], default=['maxmin', 'l1'])
+    parser.add_argument('--num-patients', type=int, default=0)
+    parser.add_argument('--presolve', action='store_true', help="solve the presolved LPs (see presolve.py)")
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=sorted(BACKENDS))
+    args = parser.parse_args()
+
+    backends = [make_backend(name) for name in args.backends]
+    print('%-40s %-7s %-7s %8s %8s %10s %12s' % ('pool', 'loss', 'backend', 'rows', 'cols', 'time', 'objective'))
+    for pool in args.pools:
+        A = pool_incidence(pool, args.num_patients)
+        for loss in args.loss:
+            lp = presolved_lp(A, loss)[0] if args.presolve else LOSSES[loss](A)
+            num_rows = sum(block[0].shape[0] for block in lp.rows)
+            for backend in backends:
+                start = time.perf_counter()
+                result = backend.solve_lp(lp)
+                runtime = time.perf_counter() - start
+                value = '%.6f' % result[1] if result is not None else 'failed'
+                print('%-40s %-7s %-7s %8d %8d %9.3fs %12s' % (pool[-40:], loss, backend.name, num_rows, lp.num_vars, runtime, value))
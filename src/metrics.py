@@ -0,0 +1,127 @@
+"""
+Python 3
+Per-patient and per-group properties of a probability distribution over a pool.
+
+Everything is derived from the patient marginals, obtained with a single sparse
+product between the patient x solution incidence matrix and the vector of
+solution probabilities (one per component for a factored pool). The group
+properties accept an array of PRA thresholds and are computed for all of them
+at once.
+"""
+import numpy as np
+
+HARD_TO_MATCH = 0.8
+
+
+def probability_vector(solution_prob_dict, num_solutions):
+    """
+    :param solution_prob_dict: probability of each solution, as a dictionary or a sequence
+    :param num_solutions: number of solutions in the pool
+    :return: array with the probability of each solution
+    """
+    probs = np.zeros(num_solutions)
+    if isinstance(solution_prob_dict, dict):
+        if len(solution_prob_dict) > 0:
+            probs[list(solution_prob_dict.keys())] = list(solution_prob_dict.values())
+    else:
+        values = np.asarray(solution_prob_dict, dtype=np.float64)
+        probs[:len(values)] = values[:num_solutions]
+    return probs
+
+
+def patient_marginals(A, probs, num_patients=None):
+    """
+    :param A: patient x solution incidence matrix, or the list of the matrices of the components of a factored pool
+    :param probs: array with the probability of each solution, or ProductDistribution over a factored pool
+    :param num_patients: keep only the first num_patients patients
+    :return: array with the probability that each patient is matched
+    """
+    if isinstance(probs, ProductDistribution):
+        return factored_marginals(A, probs, num_patients)
+    marginals = A @ probs
+    return marginals if num_patients is None else marginals[:num_patients]
+
+
+class ProductDistribution(object):
+    """
+    Distribution over a factored pool (see pool_io.FactoredPool) in which the
+    solution of every component is drawn independently from its own distribution.
+    Indexing gives the probability of a solution of the flat pool.
+    """
+
+    def __init__(self, factors):
+        self.factors = [np.asarray(probs, dtype=np.float64) for probs in factors]
+
+    def __len__(self):
+        size = 1
+        for probs in self.factors:
+            size *= len(probs)
+        return size
+
+    def __getitem__(self, i):
+        p = 1.0
+        for probs in reversed(self.factors):
+            i, k = divmod(i, len(probs))
+            p *= probs[k]
+        return p
+
+
+def factored_marginals(incidences, probs, num_patients=None):
+    """
+    :param incidences: patient x solution incidence matrices of the components, with the same rows
+    :param probs: ProductDistribution, or list with the probability of each solution of every component
+    :param num_patients: keep only the first num_patients patients
+    :return: array with the probability that each patient is matched
+    """
+    factors = probs.factors if isinstance(probs, ProductDistribution) else probs
+    # the components have disjoint patients, so their marginals add up
+    marginals = sum(A @ np.asarray(p, dtype=np.float64) for A, p in zip(incidences, factors))
+    return marginals if num_patients is None else marginals[:num_patients]
+
+
+def _groups(pra, thresholds):
+    # thresholds x patients mask of the hard-to-match patients
+    return np.asarray(pra)[None, :] >= np.atleast_1d(thresholds)[:, None]
+
+
+def group_averages(marginals, pra, thresholds=HARD_TO_MATCH):
+    """
+    Average probability of being matched of the easy (PRA < threshold) and hard
+    (PRA >= threshold) to match patients, nan for an empty group.
+    :param marginals: array with the probability that each patient is matched
+    :param pra: array with the PRA of each patient
+    :param thresholds: a threshold or an array of thresholds
+    :return: easy and hard averages, with the shape of thresholds
+    """
+    hard = _groups(pra, thresholds)
+    num_hard = hard.sum(axis=1)
+    num_easy = hard.shape[1] - num_hard
+    hard_sum = hard @ marginals
+    easy_sum = marginals.sum() - hard_sum
+    with np.errstate(divide='ignore', invalid='ignore'):
+        easy = np.where(num_easy > 0, easy_sum / num_easy, np.nan)
+        hard = np.where(num_hard > 0, hard_sum / num_hard, np.nan)
+    if np.ndim(thresholds) == 0:
+        return easy[0], hard[0]
+    return easy, hard
+
+
+def alpha(marginals, pra, thresholds=HARD_TO_MATCH):
+    """
+    Expected number of hard-to-match patients in a solution divided by the
+    number of hard-to-match patients (0 if there are none).
+    :param marginals: array with the probability that each patient is matched
+    :param pra: array with the PRA of each patient
+    :param thresholds: a threshold or an array of thresholds
+    :return: alpha, with the shape of thresholds
+    """
+    _, hard = group_averages(marginals, pra, thresholds)
+    return np.nan_to_num(hard, nan=0.0)
+
+
+def expected_opt(marginals):
+    """
+    :param marginals: array with the probability that each patient is matched
+    :return: expected number of patients in a solution
+    """
+    return marginals.sum()
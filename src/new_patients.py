@@ -3,21 +3,13 @@ from matplotlib.ticker import MaxNLocator
 import numpy as np
 import pandas as pd
 import os
+from pool_io import load_pool
+from kep_io import read_pra
 
 
 def get_solutions(filename, typefilename, size):
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-    with open(typefilename, 'r') as f:
-        pra_idx = f.readline().strip('\n').split('\t').index('%PRA')
-        pra_dict = {}
-        for i in range(size):
-            patient_info = list(f.readline().strip('\n').split('\t'))
-            pra_dict[i] = float(patient_info[pra_idx])
-    solutions = []
-    for line in lines:
-        solution = list(map(int, line.strip('\n').split(' ')))
-        solutions.append(solution)
+    solutions = load_pool(filename)
+    pra_dict = dict(enumerate(read_pra(typefilename, size).tolist()))
 
     return solutions, pra_dict
 
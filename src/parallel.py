@@ -0,0 +1,53 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI or SCIPY (see lp_backend)
+Execution of independent tasks on a pool of worker processes.
+
+Every worker owns an LP backend limited to a given number of threads (for
+Gurobi, an environment of its own), which is passed to the tasks so that their
+models are solved by it. The results are returned in the order of the tasks,
+whatever the order in which they complete.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lp_backend import make_backend
+
+_backend = None
+_key = None
+
+
+def _init_worker(backend, threads):
+    global _backend, _key
+    _backend = make_backend(backend, threads)
+    _key = (backend, threads)
+
+
+def _run(func, task):
+    return func(task, _backend)
+
+
+def run_tasks(func, tasks, workers=1, threads=None, backend='gurobi'):
+    """
+    :param func: top-level function called as func(task, backend)
+    :param tasks: list of picklable tasks
+    :param workers: number of worker processes (1 runs the tasks in this process)
+    :param threads: number of threads of the solver of every worker (None: 1 with several workers,
+        the default of the solver otherwise)
+    :param backend: name of the LP backend, a key of lp_backend.BACKENDS
+    :return: list with the result of each task
+    """
+    if workers <= 1:
+        if _key != (backend, threads):
+            _init_worker(backend, threads)
+        return [func(task, _backend) for task in tasks]
+
+    if threads is None:
+        # the workers share the cores
+        threads = 1
+
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(backend, threads)) as executor:
+        futures = {executor.submit(_run, func, task): k for k, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
@@ -0,0 +1,155 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI, SCIPY
+Position-indexed edge formulation (PIEF) of the cycles of the KEP, from
+"Position-Indexed Formulations for Kidney Exchange" (Dickerson et al.).
+
+Instead of one variable per cycle, there is one variable per arc (i,j), copy l
+and position k: the arc is the k-th arc of a cycle whose smallest vertex is l.
+Copy l only uses the vertices larger than l, the arcs leaving l are at position
+1 and the flow is conserved at every other vertex and position, so the size of
+the model is bounded by arcs x K x vertices instead of by the number of cycles.
+The arcs that can not lie on a cycle of length at most K through l at their
+position are removed with the distances from and to l.
+
+A cycle has a single representation in this formulation, so the solutions (and
+the pools) are the ones of the cycle formulation.
+"""
+from collections import deque
+
+import numpy as np
+import scipy.sparse as sp
+
+from cycles import CycleSet, get_all_cycles, _index_graph
+import profiling
+
+FORMULATIONS = ['cycle', 'pief']
+
+
+class PIEFArcs(CycleSet):
+    """
+    Arcs (copy, tail, head, position) of the PIEF, sorted by copy and position.
+    As a CycleSet, every arc is a "cycle" made of its tail: each patient of a
+    cycle is the tail of exactly one of its arcs, so the members of the chosen
+    arcs are the patients of the chosen cycles, in the order of the cycle
+    formulation.
+    """
+
+    def __init__(self, copy, tail, head, position):
+        CycleSet.__init__(self, tail, np.arange(len(tail) + 1))
+        self.copy = np.asarray(copy, dtype=np.int64)
+        self.tail = self.vertices
+        self.head = np.asarray(head, dtype=np.int64)
+        self.position = np.asarray(position, dtype=np.int64)
+
+
+def _distances(neighbours, s, K):
+    # length of the shortest path from s to every vertex, using vertices >= s only
+    dist = {s: 0}
+    queue = deque([s])
+    while queue:
+        v = queue.popleft()
+        if dist[v] == K:
+            continue
+        for u in neighbours[v]:
+            if u > s and u not in dist:
+                dist[u] = dist[v] + 1
+                queue.append(u)
+    return dist
+
+
+# INPUT
+# G - incidence list; a dictionary
+# K - maximum size for cycles length
+# OUTPUT
+# PIEFArcs with the arc variables of the cycles of length 2..K
+def pief_arcs(G, K):
+    labels, succ = _index_graph(G)
+    n = len(labels)
+    pred = [[] for _ in range(n)]
+    for i in range(n):
+        for j in succ[i]:
+            pred[j].append(i)
+    tails = np.array([i for i in range(n) for _ in succ[i]], dtype=np.int64)
+    heads = np.array([j for i in range(n) for j in succ[i]], dtype=np.int64)
+
+    copies, arc_ids, positions = [], [], []
+    for s in range(n):
+        dist_from = _distances(succ, s, K)
+        dist_to = _distances(pred, s, K)
+        if len(dist_to) == 1:
+            continue
+        df = np.array([dist_from.get(v, K + 1) for v in range(n)])
+        dt = np.array([dist_to.get(v, K + 1) for v in range(n)])
+        # position k of arc (i,j) is possible if s reaches i in k-1 arcs and j reaches s in K-k arcs
+        first = np.where(tails >= s, df[tails] + 1, K + 1)
+        last = np.where(heads >= s, K - dt[heads], 0)
+        last = np.where(tails == s, np.minimum(last, 1), last)
+        count = np.maximum(last - first + 1, 0)
+        idx = np.repeat(np.arange(len(tails)), count)
+        k = np.repeat(first, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        copies.append(np.full(len(idx), s))
+        arc_ids.append(idx)
+        positions.append(k)
+
+    if len(copies) == 0:
+        return PIEFArcs(*[np.zeros(0, dtype=np.int64)] * 4)
+    copy = np.concatenate(copies)
+    arc = np.concatenate(arc_ids)
+    position = np.concatenate(positions)
+    order = np.lexsort((arc, position, copy))
+    copy, arc, position = copy[order], arc[order], position[order]
+    to_label = np.asarray(labels, dtype=np.int64)
+    return PIEFArcs(to_label[copy], to_label[tails[arc]], to_label[heads[arc]], position)
+
+
+# INPUT
+# arcs - PIEFArcs
+# OUTPUT
+# flow conservation matrix (== 0): for every copy l, vertex v != l and position k,
+# the arcs entering v at position k minus the arcs leaving v at position k+1
+def flow_matrix(arcs):
+    if len(arcs) == 0:
+        return sp.csr_matrix((0, 0))
+    enter = arcs.head != arcs.copy
+    leave = arcs.tail != arcs.copy
+    cols = np.arange(len(arcs))
+    keys = np.concatenate([np.stack([arcs.copy[enter], arcs.head[enter], arcs.position[enter]], axis=1),
+            np.stack([arcs.copy[leave], arcs.tail[leave], arcs.position[leave] - 1], axis=1)])
+    _, rows = np.unique(keys, axis=0, return_inverse=True)
+    rows = rows.ravel()
+    data = np.concatenate([np.ones(enter.sum()), -np.ones(leave.sum())])
+    return sp.csr_matrix((data, (rows, np.concatenate([cols[enter], cols[leave]]))),
+            shape=(rows.max() + 1 if len(rows) > 0 else 0, len(arcs)))
+
+
+# INPUT
+# m - gurobi model
+# G - incidence list; a dictionary
+# K - maximum size for cycles length
+# L - maximum length of chain size
+# altruistic_list - list of altruistic nodes
+# formulation - 'cycle' (one variable per cycle) or 'pief' (one variable per arc, copy and position)
+# OUTPUT
+# variables X - dictionary from i+1 to the variable of cycle (or arc) i
+# variables Z - dictionary from (i,j,l) to the variable of arc (i,j) at position l of a chain
+# Cycles_k - CycleSet of the variables X, to be passed to extract_pool
+def build_formulation(m, G, K, L=0, altruistic_list=[], formulation='cycle'):
+    # imported here so that the arcs can be computed without gurobipy
+    from kep_model import build_KEP_model
+    if formulation == 'cycle':
+        with profiling.stage('cycles'):
+            Cycles_k = get_all_cycles(G,K)
+        with profiling.stage('build'):
+            X, Z = build_KEP_model(m, G, Cycles_k, L, altruistic_list)
+    elif formulation == 'pief':
+        with profiling.stage('cycles'):
+            Cycles_k = pief_arcs(G,K)
+        # an arc counts one transplant; as every vertex of a cycle leaves it once,
+        # the capacity rows on the tails are the ones on the heads
+        with profiling.stage('build'):
+            X, Z = build_KEP_model(m, G, Cycles_k, L, altruistic_list, cycle_obj=np.ones(len(Cycles_k)),
+                    cycle_rows=flow_matrix(Cycles_k))
+    else:
+        raise ValueError("unknown formulation %s" % formulation)
+    return X, Z, Cycles_k
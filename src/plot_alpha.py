@@ -1,11 +1,19 @@
-from alpha import main
+import argparse
+
+from alpha import instances_profile
+from result_cache import ResultCache, DEFAULT_CACHE_DIR
+from lp_backend import BACKENDS
 from matplotlib import pyplot as plt
 
 
-def plot():
+def plot(sizes=[20,30,40,50,60,70], workers=1, threads=None, cache=None, backend='gurobi', presolve=True):
+    # with a cache, a rerun with the same backend and presolve only solves the fairness problems of the
+    # pools that changed; the cache key holds the loss, the l2 solver, the backend and presolve
     inst_dicts = {}
-    for method in ["maxmin", "l1", "l2"]:
-        inst_dicts[method] = main(method)
+    # the l2 QP needs gurobi, the other backends use the first-order solver
+    l2 = "l2" if backend == 'gurobi' else "l2-gradient"
+    for method, loss in [("maxmin", "maxmin"), ("l1", "l1"), ("l2", l2)]:
+        inst_dicts[method] = instances_profile(loss, sizes, workers, threads, cache, backend, presolve)
     fig = plt.figure()
     ax = fig.subplots()
 
@@ -13,8 +21,8 @@ def plot():
     ax.set_ylabel("Expected number of hard-to-match patients in a solution")
 
     for key, inst_dict in inst_dicts.items():
-        x = [20,30,40,50,60,70]
-        y = [df['base_', 'alpha'].mean() for size, df in inst_dict.items()]
+        x = list(inst_dict.keys())
+        y = [df['alpha', 'base_'].mean() for size, df in inst_dict.items()]
 
         ax.plot(x,y, label=key)
 
@@ -23,5 +31,14 @@ def plot():
 
 
 if __name__ == "__main__":
-    plot()
-
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--threads', type=int, default=None,
+            help="Number of solver threads of each worker (default: 1 with several workers, the solver's default otherwise)")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='gurobi', help="Solver of the fairness LPs")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Directory where the distributions are cached")
+    parser.add_argument('--no-cache', action='store_true', help="Always solve the fairness problems")
+    parser.add_argument('--no-presolve', action='store_true', help="Solve the fairness problems over the whole pools")
+    args = parser.parse_args()
+    plot(workers=args.workers, threads=args.threads, cache=None if args.no_cache else ResultCache(args.cache_dir),
+            backend=args.backend, presolve=not args.no_presolve)
@@ -0,0 +1,390 @@
+"""
+Python 3
+Reading and writing of solution pools.
+
+A pool is a sequence of solutions, each one the list of patients it matches. Two
+file formats are supported:
+- text: one solution per line, patients separated by spaces
+- binary: a compact CSR layout that is written in a streaming fashion and read
+  back through np.memmap, so the rows are never parsed into Python objects
+- factored: a directory with the pools (text or binary) of independent
+  components, see decompose.py, and a manifest; the solutions are the products
+  of one solution of every component, which are never written out
+
+Layout of the binary format (little endian):
+    header   64 bytes: magic, itemsize, num_patients, num_rows, nnz
+    indices  nnz unsigned ints of itemsize bytes, padded to 8 bytes
+    offsets  num_rows+1 int64, row i is indices[offsets[i]:offsets[i+1]]
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import struct
+import tempfile
+
+import numpy as np
+import scipy.sparse as sp
+
+MAGIC = b'KEPPOOL1'
+HEADER = struct.Struct('<8sIqqq')
+HEADER_SIZE = 64
+DTYPES = {1: np.uint8, 2: np.uint16, 4: np.uint32}
+MANIFEST = 'manifest.json'
+FACTORED_VERSION = 1
+
+
+def index_itemsize(num_patients):
+    """
+    Smallest number of bytes able to store the patient ids of a pool.
+    :param num_patients: number of patients (None if unknown)
+    :return: 1, 2 or 4
+    """
+    if num_patients is None:
+        return 4
+    for itemsize in (1, 2):
+        if num_patients <= 1 << (8 * itemsize):
+            return itemsize
+    return 4
+
+
+class PoolWriter(object):
+    """
+    Streaming writer of binary pools. The patient ids are written to the file as
+    soon as a solution is added and the row offsets are spooled to a temporary
+    file, so memory does not depend on the size of the pool.
+    """
+
+    def __init__(self, filename, num_patients=None):
+        self.filename = filename
+        self.num_patients = num_patients
+        self.itemsize = index_itemsize(num_patients)
+        self.dtype = np.dtype(DTYPES[self.itemsize]).newbyteorder('<')
+        self.num_rows = 0
+        self.nnz = 0
+        self.f = open(filename, 'wb')
+        self.f.write(b'\0' * HEADER_SIZE)
+        self.offsets = tempfile.TemporaryFile()
+        self.offsets.write(np.int64(0).astype('<i8').tobytes())
+
+    def write(self, solution):
+        """
+        :param solution: iterable with the patients of a solution
+        """
+        row = np.asarray(solution, dtype=np.int64)
+        if len(row) > 0 and (row.min() < 0 or (self.num_patients is not None and row.max() >= self.num_patients)):
+            raise ValueError("patient id out of range in solution %d" % self.num_rows)
+        self.f.write(row.astype(self.dtype).tobytes())
+        self.nnz += len(row)
+        self.num_rows += 1
+        self.offsets.write(np.int64(self.nnz).astype('<i8').tobytes())
+
+    def close(self):
+        if self.f is None:
+            return
+        self.f.write(b'\0' * (-(self.nnz * self.itemsize) % 8))
+        self.offsets.seek(0)
+        shutil.copyfileobj(self.offsets, self.f)
+        self.offsets.close()
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, self.itemsize, self.num_patients or 0, self.num_rows, self.nnz))
+        self.f.close()
+        self.f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SolutionPool(object):
+    """
+    Binary pool mapped in memory. Indexing returns the patients of a solution as
+    a read-only view of the file.
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            magic, itemsize, num_patients, num_rows, nnz = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a binary solution pool" % filename)
+        self.filename = filename
+        self.num_patients = num_patients if num_patients > 0 else None
+        dtype = np.dtype(DTYPES[itemsize]).newbyteorder('<')
+        if nnz > 0:
+            self.indices = np.memmap(filename, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(nnz,))
+        else:
+            self.indices = np.zeros(0, dtype=dtype)
+        offset = HEADER_SIZE + nnz * itemsize
+        offset += -offset % 8
+        self.offsets = np.memmap(filename, dtype='<i8', mode='r', offset=offset, shape=(num_rows + 1,))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.indices[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def lengths(self):
+        """
+        :return: array with the number of patients of each solution
+        """
+        return np.diff(self.offsets)
+
+
+def product_solutions(pools):
+    """
+    :param pools: list of the pools of independent components
+    :return: generator over the concatenations of one solution of every pool, the last pool varying fastest
+    """
+    for product in itertools.product(*pools):
+        yield [int(v) for part in product for v in part]
+
+
+class FactoredPool(object):
+    """
+    Pool stored as the pools of its independent components. It behaves as the
+    (flat) pool of the products, so that it can be read by any consumer of
+    pools, while the components are available in the components attribute.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != FACTORED_VERSION:
+            raise ValueError("%s has an unsupported factored pool version" % directory)
+        self.directory = directory
+        self.num_patients = manifest.get('num_patients')
+        self.components = [load_pool(os.path.join(directory, c['file'])) for c in manifest['components']]
+        self.sizes = [len(pool) for pool in self.components]
+
+    def __len__(self):
+        size = 1
+        for n in self.sizes:
+            size *= n
+        return size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        parts = []
+        for pool, n in zip(reversed(self.components), reversed(self.sizes)):
+            i, k = divmod(i, n)
+            parts.append(pool[k])
+        return [int(v) for part in reversed(parts) for v in part]
+
+    def __iter__(self):
+        return product_solutions(self.components)
+
+    def incidences(self, num_patients=None):
+        """
+        :param num_patients: number of rows (default: largest patient id + 1)
+        :return: list with the patient x solution incidence matrix of every component, with the same rows
+        """
+        if num_patients is None:
+            num_patients = self.num_patients
+        matrices = [incidence_matrix(pool, num_patients) for pool in self.components]
+        rows = max([A.shape[0] for A in matrices] or [0])
+        return [sp.csr_matrix((A.data, A.indices, np.concatenate([A.indptr, np.full(rows - A.shape[0], A.indptr[-1])])),
+                shape=(rows, A.shape[1])) for A in matrices]
+
+
+def is_factored_pool(path):
+    """
+    :param path: path of a pool
+    :return: True if the path is a directory holding a factored pool
+    """
+    return os.path.isdir(path) and os.path.isfile(os.path.join(path, MANIFEST))
+
+
+def pool_files(path):
+    """
+    :param path: path of a pool
+    :return: list of the files holding the pool: the manifest and the component files of a factored pool
+    """
+    if not is_factored_pool(path):
+        return [path]
+    with open(os.path.join(path, MANIFEST), 'r') as f:
+        manifest = json.load(f)
+    return [os.path.join(path, MANIFEST)] + [os.path.join(path, c['file']) for c in manifest['components']]
+
+
+def save_factored(directory, pools, binary=False, num_patients=None):
+    """
+    Method to save the pools of independent components as a factored pool
+    :param directory: directory of the pool, created if needed
+    :param pools: list of the pools (iterables of solutions) of the components
+    :param binary: write the pools of the components in the binary format
+    :param num_patients: number of patients
+    :return: number of solutions of the product
+    """
+    os.makedirs(directory, exist_ok=True)
+    components = []
+    size = 1
+    for k, pool in enumerate(pools):
+        name = 'component%d.%s' % (k, 'bin' if binary else 'txt')
+        n = save_to_file(os.path.join(directory, name), pool, binary, num_patients)
+        components.append({'file': name, 'num_solutions': n})
+        size *= n
+    # written last, so that an interrupted write is not read as a pool
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump({'version': FACTORED_VERSION, 'num_patients': num_patients, 'num_solutions': size,
+                'components': components}, f, indent=1)
+    return size
+
+
+def is_binary_pool(filename):
+    """
+    :param filename: String giving the filename
+    :return: True if the file is in the binary pool format
+    """
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_text_pool(filename):
+    """
+    :param filename: String giving the filename of a text pool
+    :return: the list of solutions, each one a list of patients
+    """
+    with open(filename, 'r') as f:
+        return [list(map(int, line.split())) for line in f]
+
+
+def load_pool(filename):
+    """
+    Load a pool in any format.
+    :param filename: String giving the filename (the directory of a factored pool)
+    :return: a SolutionPool for binary pools, a FactoredPool for factored pools,
+             a list of solutions for text pools
+    """
+    if is_factored_pool(filename):
+        return FactoredPool(filename)
+    if is_binary_pool(filename):
+        return SolutionPool(filename)
+    return read_text_pool(filename)
+
+
+def _chunk(solutions, start, stop):
+    # patients of the solutions start..stop-1 as (flat ids, lengths)
+    if isinstance(solutions, SolutionPool):
+        offsets = np.asarray(solutions.offsets[start:stop+1])
+        ids = np.asarray(solutions.indices[offsets[0]:offsets[-1]], dtype=np.int64)
+        return ids, np.diff(offsets)
+    rows = [np.asarray(solutions[i], dtype=np.int64) for i in range(start, stop)]
+    lengths = np.array([len(row) for row in rows], dtype=np.int64)
+    ids = np.concatenate(rows) if lengths.sum() > 0 else np.zeros(0, dtype=np.int64)
+    return ids, lengths
+
+
+def canonical_bitsets(solutions, start, stop, num_patients):
+    """
+    Canonical representation of the patient sets of solutions start..stop-1 as
+    rows of packed bits, which does not depend on the order of the patients nor
+    on the cycles that cover them.
+    :return: uint8 array of shape (stop-start, ceil(num_patients/8))
+    """
+    ids, lengths = _chunk(solutions, start, stop)
+    bits = np.zeros((stop - start, num_patients), dtype=bool)
+    bits[np.repeat(np.arange(stop - start), lengths), ids] = True
+    return np.packbits(bits, axis=1)
+
+
+def dedup_pool(solutions, num_patients=None, chunk_size=8192):
+    """
+    Global deduplication of a pool by patient set, in one streaming pass.
+    :param solutions: SolutionPool or list of solutions
+    :param num_patients: number of patients (default: largest patient id + 1)
+    :param chunk_size: number of solutions converted to bitsets at once
+    :return: index of the first occurrence of every distinct patient set, in
+             order of appearance, and the number of times each one occurs
+    """
+    if num_patients is None:
+        num_patients = getattr(solutions, 'num_patients', None)
+    if num_patients is None:
+        num_patients = max([max(solution) + 1 for solution in solutions if len(solution) > 0] or [0])
+    seen = {}
+    first = []
+    counts = []
+    for start in range(0, len(solutions), chunk_size):
+        stop = min(start + chunk_size, len(solutions))
+        keys = canonical_bitsets(solutions, start, stop, num_patients)
+        for i, key in enumerate(keys):
+            key = key.tobytes()
+            k = seen.get(key)
+            if k is None:
+                seen[key] = len(first)
+                first.append(start + i)
+                counts.append(1)
+            else:
+                counts[k] += 1
+    return np.array(first, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+
+def incidence_matrix(solutions, num_patients=None):
+    """
+    Patient x solution incidence matrix of a pool.
+    :param solutions: SolutionPool or list of solutions
+    :param num_patients: number of rows (default: largest patient id + 1)
+    :return: scipy.sparse.csr_matrix with a 1 where a patient is in a solution
+    """
+    if isinstance(solutions, SolutionPool):
+        ids, indptr = solutions.indices, solutions.offsets
+    else:
+        ids, lengths = _chunk(solutions, 0, len(solutions))
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+    if num_patients is None:
+        num_patients = int(ids.max()) + 1 if len(ids) > 0 else 0
+    else:
+        num_patients = max(num_patients, int(ids.max()) + 1 if len(ids) > 0 else 0)
+    # the solution x patient matrix is already in CSR form, its transpose in CSC
+    A = sp.csc_matrix((np.ones(len(ids)), np.asarray(ids, dtype=np.int64), np.asarray(indptr, dtype=np.int64)),
+            shape=(num_patients, len(indptr) - 1))
+    return A.tocsr()
+
+
+def save_to_file(filename, solutions, binary=False, num_patients=None):
+    """
+    Method to save solutions to file
+    :param filename: String giving the filename
+    :param solutions: The iterable of solutions to save to file
+    :param binary: write the binary format instead of text
+    :param num_patients: number of patients, used to pick the size of the ids
+    :return: number of solutions written
+    """
+    num_rows = 0
+    if binary:
+        with PoolWriter(filename, num_patients) as writer:
+            for solution in solutions:
+                writer.write(solution)
+            num_rows = writer.num_rows
+    else:
+        with open(filename, 'w') as f:
+            for solution in solutions:
+                f.write(" ".join(map(str, solution)) + "\n")
+                num_rows += 1
+    return num_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert solution pools between the text and binary formats")
+    parser.add_argument('command', choices=['import', 'export'], help="import: text to binary, export: binary to text")
+    parser.add_argument('infile')
+    parser.add_argument('outfile')
+    parser.add_argument('--num-patients', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        with open(args.infile, 'r') as f:
+            n = save_to_file(args.outfile, (list(map(int, line.split())) for line in f), True, args.num_patients)
+    else:
+        n = save_to_file(args.outfile, SolutionPool(args.infile))
+    print('number of solutions %d' % n)
@@ -0,0 +1,109 @@
+"""
+Python 3
+Presolve of the fairness problems over a pool.
+
+A solution whose patient set is contained in the set of another solution is
+never needed by the maxmin loss: moving its probability to the larger solution
+does not decrease the probability of any patient. The other losses compare the
+patients with their mean, so only identical solutions can be merged. The
+patients of no solution have probability 0 whatever the distribution, so their
+rows are dropped and the losses account for them through their number only.
+For maxmin, a patient whose solutions are the ones of another patient, or who
+is in every solution, adds no constraint either.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+PRESOLVE_LOSSES = ['maxmin', 'l1', 'l2']
+
+
+class Presolved(object):
+    """
+    Reduced incidence matrix, with the solutions (columns) and patients (rows)
+    of the original matrix it keeps.
+    """
+
+    def __init__(self, A, columns, rows, num_uncovered, shape):
+        self.A = A
+        self.columns = columns
+        self.rows = rows
+        self.num_uncovered = num_uncovered
+        self.shape = shape
+
+    @property
+    def stats(self):
+        return {'columns_removed': self.shape[1] - len(self.columns), 'rows_removed': self.shape[0] - len(self.rows)}
+
+    def expand(self, x):
+        """
+        :param x: probability of each kept solution (extra variables of the reduced problem are ignored)
+        :return: probability of each solution of the original matrix, 0 for the removed ones
+        """
+        probs = np.zeros(self.shape[1])
+        probs[self.columns] = x[:len(self.columns)]
+        return probs
+
+
+def _duplicates(M):
+    # True for the rows of the csr matrix M equal to an earlier row
+    M = sp.csr_matrix(M)
+    M.sort_indices()
+    seen = set()
+    duplicate = np.zeros(M.shape[0], dtype=bool)
+    for i in range(M.shape[0]):
+        key = M.indices[M.indptr[i]:M.indptr[i+1]].tobytes()
+        if key in seen:
+            duplicate[i] = True
+        else:
+            seen.add(key)
+    return duplicate
+
+
+def dominated_columns(A, block_bytes=1 << 25):
+    """
+    :param A: patient x solution incidence matrix
+    :param block_bytes: size of the blocks of the solution x solution overlap matrix computed at once
+    :return: boolean array, True for the solutions contained in a larger one or equal to an earlier one
+    """
+    S = sp.csr_matrix(A.T != 0, dtype=np.int32)
+    dominated = _duplicates(S)
+    unique = np.flatnonzero(~dominated)
+    sizes = np.diff(S.indptr)[unique]
+    levels = np.unique(sizes)
+    # a set can only be contained in a larger one, so equal sizes leave nothing to compare
+    for size in levels[:-1]:
+        small = unique[sizes == size]
+        larger = unique[sizes > size]
+        LT = S[larger].T.tocsc()
+        block = max(1, block_bytes // (4 * len(larger)))
+        for start in range(0, len(small), block):
+            cols = small[start:start+block]
+            overlap = (S[cols] @ LT).tocsr()
+            # the solutions whose overlap with a larger solution is the whole solution
+            row = np.repeat(np.arange(len(cols)), np.diff(overlap.indptr))
+            dominated[cols[np.unique(row[overlap.data == size])]] = True
+    return dominated
+
+
+def reduce_pool(A, loss):
+    """
+    :param A: patient x solution incidence matrix
+    :param loss: 'maxmin', 'l1' or 'l2'
+    :return: Presolved
+    """
+    if loss not in PRESOLVE_LOSSES:
+        raise ValueError("unknown loss %s" % loss)
+    A = sp.csr_matrix(A)
+    if loss == 'maxmin':
+        columns = np.flatnonzero(~dominated_columns(A))
+    else:
+        columns = np.flatnonzero(~_duplicates(A.T))
+    B = A[:, columns].tocsr()
+    covered = np.diff(B.indptr) > 0
+    num_uncovered = int((~covered).sum())
+    keep = covered
+    if loss == 'maxmin':
+        keep = covered & (np.diff(B.indptr) < len(columns))
+        keep[keep] = ~_duplicates(B[keep])
+    rows = np.flatnonzero(keep)
+    return Presolved(B[rows], columns, rows, num_uncovered, A.shape)
@@ -0,0 +1,207 @@
+"""
+Python 3
+Per-stage profiling of the solvers.
+
+A Profiler records, for every stage of a run (parse, cycles, build, each
+optimize call, pool extraction, write...), its wall time, the number of times it
+was entered, the RSS of the process at its end, the peak RSS of the process so
+far and, when tracemalloc is on, the peak of the memory allocated by Python
+during the stage. It also keeps the statistics of the models after every
+optimize call, with the Gurobi work units.
+
+The code of the solvers opens its stages with profiling.stage(name), which does
+nothing unless a profiler was activated (see enable, and the --profile option of
+the command lines). Stages may be nested: the pool extraction runs inside the
+write stage, as the pool is extracted while it is written.
+"""
+import os, sys, json, time, resource, tracemalloc
+from contextlib import contextmanager
+
+
+def current_rss():
+    # resident set size in bytes (Linux), 0 where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+MODEL_ATTRIBUTES = ['NumVars', 'NumConstrs', 'NumNZs', 'NumIntVars', 'Status', 'SolCount',
+        'NodeCount', 'IterCount', 'Runtime', 'Work']
+
+
+def model_stats(model):
+    """
+    :param model: gurobi model after an optimize call
+    :return: dictionary of the attributes of MODEL_ATTRIBUTES that are available
+    """
+    stats = {}
+    for name in MODEL_ATTRIBUTES:
+        try:
+            stats[name] = model.getAttr(name)
+        except Exception:
+            # e.g. Work with an old version of gurobi
+            pass
+    return stats
+
+
+class Profiler(object):
+    """
+    Time and memory of the stages of a run.
+    """
+
+    def __init__(self, trace_memory=False):
+        """
+        :param trace_memory: measure the Python allocations of every stage with tracemalloc (slower)
+        """
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.models = []
+        self.stack = []
+        # outermost stage left by an exception, see benchmark.run_instance
+        self.failed = None
+        self.start = time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            # the peak of the enclosing stage so far is saved before it is reset
+            if self.stack:
+                self.stack[-1][1] = max(self.stack[-1][1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        if not self.stack:
+            self.failed = None
+        frame = [name, 0]
+        self.stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.failed = name
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stack.pop()
+            record = self.stages.setdefault(name, {'time': 0.0, 'count': 0})
+            record['time'] += elapsed
+            record['count'] += 1
+            record['rss'] = current_rss()
+            record['peak_rss'] = max(peak_rss(), record['rss'])
+            if self.trace_memory:
+                peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                record['py_peak'] = max(record.get('py_peak', 0), peak)
+                if self.stack:
+                    self.stack[-1][1] = max(self.stack[-1][1], peak)
+                tracemalloc.reset_peak()
+
+    def run(self, name, func, *args):
+        with self.stage(name):
+            return func(*args)
+
+    def model(self, model, name):
+        """
+        :param model: gurobi model after an optimize call
+        :param name: name of the optimize call
+        """
+        self.models.append(dict(model_stats(model), name=name))
+
+    def summary(self):
+        """
+        :return: dictionary with the stages, the models and the total time, for JSON
+        """
+        work = sum(stats.get('Work', 0.0) for stats in self.models)
+        return {'total_time': time.perf_counter() - self.start, 'stages': self.stages,
+                'models': self.models, 'work': work}
+
+    def write(self, filename=None):
+        """
+        :param filename: file where the summary is written as JSON, stderr if None
+        """
+        text = json.dumps(self.summary(), indent=1)
+        if filename is None:
+            print(text, file=sys.stderr)
+        else:
+            with open(filename, 'w') as f:
+                f.write(text + '\n')
+
+
+_active = None
+
+
+def enable(trace_memory=False):
+    """
+    Activate a profiler for the stages of the solvers.
+    :param trace_memory: see Profiler
+    :return: the Profiler
+    """
+    global _active
+    _active = Profiler(trace_memory)
+    return _active
+
+
+def disable():
+    # stop recording the stages of the solvers
+    global _active
+    _active = None
+
+
+def active():
+    # the active Profiler, None if profiling is off
+    return _active
+
+
+@contextmanager
+def stage(name):
+    # stage of the active profiler, nothing if profiling is off
+    if _active is None:
+        yield
+    else:
+        with _active.stage(name):
+            yield
+
+
+def optimize(model, name='optimize', callback=None):
+    """
+    model.optimize, as a stage of the active profiler that also records the model statistics.
+    :param model: gurobi model
+    :param name: name of the stage
+    :param callback: callback passed to optimize
+    """
+    with stage(name):
+        if callback is None:
+            model.optimize()
+        else:
+            model.optimize(callback)
+    if _active is not None:
+        _active.model(model, name)
+
+
+def add_profile_arguments(parser):
+    # options of the profiling of a run
+    parser.add_argument('--profile', nargs='?', const='-', default=None, metavar='FILE',
+            help="Profile the stages of the run and write a JSON summary to FILE (stderr without FILE)")
+    parser.add_argument('--profile-memory', action='store_true',
+            help="With --profile, also record the peak of the Python allocations of every stage (tracemalloc, slower)")
+
+
+def profile_from_args(args):
+    """
+    :param args: arguments parsed with the options of add_profile_arguments
+    :return: the active Profiler, None without --profile
+    """
+    return enable(args.profile_memory) if args.profile is not None else None
+
+
+def write_profile(args):
+    # write the summary of the active profiler, if --profile was given
+    if _active is not None and args.profile is not None:
+        _active.write(None if args.profile == '-' else args.profile)
@@ -9,29 +9,29 @@ import random
 import operator
 import os.path
 from os import path
+from pool_io import load_pool, dedup_pool, is_factored_pool
 
 
 # In[2]:
 
 
-def process_solutions(solution_file):
-    solutions = []
+def process_solutions(solution_file, return_counts=False):
+    """
+    Read a pool (text or binary) and keep a single solution per distinct set of
+    patients, in order of first appearance. The solutions of binary pools are
+    views of the memory mapped file.
+    :param solution_file: String giving the filename
+    :param return_counts: also return how many times each patient set occurs
+    """
+    # the product of the components of a factored pool is exponential, see instance_context.FactoredPoolData
+    if is_factored_pool(solution_file):
+        raise ValueError("%s is a factored pool, read its components with instance_context" % solution_file)
     if path.isfile(solution_file):
-        with open(solution_file, 'r') as sf:
-            lines = sf.readlines()
-            #print(len(lines))
-            for line in lines:
-                line = line.replace('\n','')
-                s = line.split(' ')
-                if len(s)>0:
-                    fixed_s = fix(s)
-                    if len(solutions)>0:
-                        if fixed_s==solutions[-1]:
-                            pass
-                        else:
-                            solutions.append(fixed_s)    
-                    else:
-                        solutions.append(fixed_s)
+        pool = load_pool(solution_file)
+        first, counts = dedup_pool(pool)
+        solutions = [pool[i] for i in first]
+        if return_counts:
+            return solutions, counts
         return solutions
 
 
@@ -0,0 +1,160 @@
+"""
+Python 3
+On-disk cache of the probability distributions computed over the pools.
+
+An entry is a compressed .npz file holding the probability of every solution of
+the deduplicated pool (of every component, one after the other, for a factored
+pool). Its name is a hash of the content of the pool files, of
+the loss and of the solver settings, so that an entry is never read back for a
+pool that changed on disk and the entries of different pools or losses never
+collide. Entries are written to a temporary file and renamed, so that several
+processes can share the same directory.
+"""
+import os, hashlib, json, tempfile
+
+import numpy as np
+
+from metrics import ProductDistribution, probability_vector
+from pool_io import pool_files
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = 'experiments/all_solution_cp/cache'
+
+
+def file_digest(filename, block_size=1 << 20):
+    """
+    :param filename: path of the file
+    :param block_size: number of bytes read at once
+    :return: hexadecimal sha256 of the content of the file
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Directory of probability vectors keyed by pool content, loss and settings.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        # the digest of a file is only recomputed when its size or mtime change
+        self.digests = {}
+        self.hits = 0
+        self.misses = 0
+
+    def pool_digest(self, solution_file):
+        files = pool_files(solution_file)
+        stats = [os.stat(filename) for filename in files]
+        key = tuple((os.path.abspath(filename), stat.st_mtime_ns, stat.st_size) for filename, stat in zip(files, stats))
+        if key not in self.digests:
+            if len(files) == 1:
+                self.digests[key] = file_digest(solution_file)
+            else:
+                # manifest and component files of a factored pool
+                h = hashlib.sha256()
+                for filename in files:
+                    h.update(('%s %s\n' % (os.path.relpath(filename, solution_file), file_digest(filename))).encode())
+                self.digests[key] = h.hexdigest()
+        return self.digests[key]
+
+    def key(self, solution_file, loss, num_patients, settings=None):
+        """
+        :param solution_file: path of the pool
+        :param loss: name of the loss (or of the function computing the distribution)
+        :param num_patients: number of patients
+        :param settings: dictionary of the solver settings that change the result
+        :return: hexadecimal name of the entry
+        """
+        description = {'version': CACHE_VERSION, 'pool': self.pool_digest(solution_file), 'loss': loss,
+                'num_patients': num_patients, 'settings': settings or {}}
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def load(self, key):
+        """
+        :param key: name of the entry
+        :return: the probability vector, or None if the entry does not exist
+        """
+        try:
+            with np.load(self.path(key)) as data:
+                return data['probs']
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def store(self, key, probs):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, probs=probs)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, solution_file, loss, num_patients, compute, num_solutions, settings=None):
+        """
+        :param solution_file: path of the pool
+        :param loss: name of the loss
+        :param num_patients: number of patients
+        :param compute: function without arguments returning the distribution (dictionary or sequence)
+        :param num_solutions: number of solutions in the deduplicated pool
+        :param settings: dictionary of the solver settings that change the result
+        :return: array with the probability of each solution
+        """
+        key = self.key(solution_file, loss, num_patients, settings)
+        probs = self.load(key)
+        if probs is not None and len(probs) == num_solutions:
+            self.hits += 1
+            return probs
+        self.misses += 1
+        result = compute()
+        probs = probability_vector(result, num_solutions)
+        # a failed solve (empty distribution) is not cached so that it is retried
+        if len(result) > 0:
+            self.store(key, probs)
+        return probs
+
+
+def fair_distribution(cache, context, num_patients, fair_alg, backend=None, settings=None):
+    """
+    :param cache: ResultCache, or None to always solve
+    :param context: InstanceContext of the instance
+    :param num_patients: number of patients
+    :param fair_alg: function computing the distribution, called as
+        fair_alg(context, num_patients, backend=backend, presolve=presolve)
+    :param backend: LP backend passed to fair_alg (see lp_backend), its name is part of the key
+    :param settings: dictionary of the solver settings that change the result, with presolve (default True)
+    :return: array with the probability of each solution, a ProductDistribution for a factored pool
+    """
+    settings = dict({'presolve': True}, **(settings or {}))
+    presolve = settings['presolve']
+    if not context.pool.factored:
+        num_solutions = len(context.solutions)
+        compute = lambda: fair_alg(context, num_patients, backend=backend, presolve=presolve)
+    else:
+        # the factors are stored one after the other
+        sizes = context.pool.sizes
+        num_solutions = sum(sizes)
+
+        def compute():
+            result = fair_alg(context, num_patients, backend=backend, presolve=presolve)
+            if isinstance(result, ProductDistribution):
+                return np.concatenate(result.factors)
+            return result
+    if cache is None:
+        probs = probability_vector(compute(), num_solutions)
+    else:
+        # alternative optima of the backends may differ
+        settings['backend'] = backend.name if backend is not None else 'gurobi'
+        probs = cache.get(context.solution_file, fair_alg.__name__, num_patients, compute, num_solutions, settings)
+    if context.pool.factored:
+        return ProductDistribution(np.split(probs, np.cumsum(sizes)[:-1]))
+    return probs
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Multi-period simulation of a kidney exchange pool.
+
+Pairs enter the pool over the periods, drawn with replacement from the pairs
+of an instance: a new pair is compatible with the pairs of the pool as its
+original is with theirs. A pair leaves the pool after a random sojourn, or when
+it is matched. At every period the pool is matched by the cycle and
+position-indexed chain formulation of kep_model, and the pairs of the chosen
+cycles and chains are removed.
+
+The model is not rebuilt at every period: a DynamicKEP adds the rows of a new
+pair, the cycles through it (see cycles.cycles_through) and its chain arcs to
+the Gurobi model, and removes the variables and rows of a pair that leaves, so
+that a period costs its changes and its optimize call. The positions of the
+chain arcs are not pruned with the distance from the altruistic donors, which
+would change with every arrival and departure; the optimal value is the one of
+build_KEP_model (see --check).
+
+Every period gives a record, written as a line of JSON with --output:
+    {"period", "arrivals", "departures", "pool", "cycles", "variables", "constraints", "added", "removed",
+     "transplants", "update_time", "solve_time", "remove_time", "latency"}
+with "rebuild_time" and "rebuild_objective" of a model built from scratch, with --check.
+"""
+import sys, json, time, argparse
+
+import numpy as np
+from gurobipy import Model, Column, LinExpr, GRB, setParam
+
+from cycles import cycles_through
+from kep_io import read_kep
+from pief import build_formulation
+import profiling
+from profiling import add_profile_arguments, profile_from_args, write_profile
+
+
+class DynamicKEP(object):
+    """
+    KEP model of a changing pool, updated in place as pairs enter and leave it.
+    """
+
+    def __init__(self, K, L=0, env=None):
+        """
+        :param K: maximum size for cycles length
+        :param L: maximum length of chain size
+        :param env: gurobi environment, None for the default one
+        """
+        self.K = K
+        self.L = L
+        self.m = Model("Dynamic KEP", env=env) if env is not None else Model("Dynamic KEP")
+        self.m.ModelSense = -1 # maximize
+        self.succ = {}
+        self.pred = {}
+        self.altruistic = set()
+        # rows of every vertex: receives at most one kidney, flow of the chains, altruistic donor
+        self.capacity = {}
+        self.flow = {}
+        self.alt = {}
+        # variables of the cycles and chain arcs, and the ones of every vertex
+        self.cycles = {}
+        self.arcs = {}
+        self.cycles_of = {}
+        self.arcs_of = {}
+        self.added = 0
+        self.removed = 0
+
+    def __len__(self):
+        return len(self.succ)
+
+    def __contains__(self, v):
+        return v in self.succ
+
+    def graph(self):
+        # incidence list of the pool
+        return {v: sorted(self.succ[v]) for v in self.succ}
+
+    def _positions(self, i):
+        # positions in a chain at which an arc leaving i can be used
+        return [1] if i in self.altruistic else range(2, self.L + 1)
+
+    def _add_arcs(self, i, j):
+        m = self.m
+        for l in self._positions(i):
+            coeffs, constrs = [1.0], [self.capacity[j]]
+            if (j, l) in self.flow:
+                # enters j at position l
+                coeffs.append(1.0)
+                constrs.append(self.flow[(j, l)])
+            if (i, l - 1) in self.flow:
+                # leaves i at position l
+                coeffs.append(-1.0)
+                constrs.append(self.flow[(i, l - 1)])
+            if i in self.alt:
+                coeffs.append(1.0)
+                constrs.append(self.alt[i])
+            key = (i, j, l)
+            self.arcs[key] = m.addVar(obj=1.0, vtype=GRB.BINARY, column=Column(coeffs, constrs))
+            self.arcs_of[i].add(key)
+            self.arcs_of[j].add(key)
+            self.added += 1
+
+    def add(self, v, successors, predecessors, altruistic=False):
+        """
+        :param v: new vertex
+        :param successors: vertices of the pool that can receive the kidney of the donor of v
+        :param predecessors: vertices of the pool whose donor can give a kidney to v
+        :param altruistic: True if v is an altruistic donor
+        """
+        m = self.m
+        self.succ[v] = set(successors)
+        self.pred[v] = set(predecessors)
+        for u in self.succ[v]:
+            self.pred[u].add(v)
+        for u in self.pred[v]:
+            self.succ[u].add(v)
+        self.capacity[v] = m.addLConstr(LinExpr(), GRB.LESS_EQUAL, 1.0)
+        if altruistic:
+            self.altruistic.add(v)
+            self.alt[v] = m.addLConstr(LinExpr(), GRB.LESS_EQUAL, 1.0)
+        else:
+            for l in range(1, self.L):
+                self.flow[(v, l)] = m.addLConstr(LinExpr(), GRB.GREATER_EQUAL, 0.0)
+        self.cycles_of[v] = set()
+        self.arcs_of[v] = set()
+
+        # the cycles of the other vertices were added with them
+        for cycle in cycles_through(self.succ, self.pred, v, self.K):
+            column = Column([1.0] * len(cycle), [self.capacity[u] for u in cycle])
+            self.cycles[cycle] = m.addVar(obj=len(cycle), vtype=GRB.BINARY, column=column)
+            for u in cycle:
+                self.cycles_of[u].add(cycle)
+            self.added += 1
+        for u in self.succ[v]:
+            self._add_arcs(v, u)
+        for u in self.pred[v]:
+            self._add_arcs(u, v)
+
+    def remove(self, v):
+        """
+        :param v: vertex of the pool, removed with its cycles and chain arcs
+        """
+        variables = []
+        for cycle in self.cycles_of.pop(v):
+            for u in cycle:
+                if u != v:
+                    self.cycles_of[u].discard(cycle)
+            variables.append(self.cycles.pop(cycle))
+        for key in self.arcs_of.pop(v):
+            other = key[1] if key[0] == v else key[0]
+            self.arcs_of[other].discard(key)
+            variables.append(self.arcs.pop(key))
+        constrs = [self.capacity.pop(v)]
+        if v in self.alt:
+            constrs.append(self.alt.pop(v))
+        constrs.extend(self.flow.pop((v, l)) for l in range(1, self.L) if (v, l) in self.flow)
+        self.m.remove(variables)
+        self.m.remove(constrs)
+        self.removed += len(variables)
+
+        for u in self.succ.pop(v):
+            self.pred[u].discard(v)
+        for u in self.pred.pop(v):
+            self.succ[u].discard(v)
+        self.altruistic.discard(v)
+
+    def solve(self):
+        """
+        :return: optimal value and sorted list of the matched vertices
+        """
+        m = self.m
+        m.update()
+        profiling.optimize(m)
+        if m.Status != GRB.OPTIMAL:
+            raise RuntimeError("the matching of the pool ended with status %d" % m.Status)
+        matched = set()
+        if self.cycles:
+            values = m.getAttr("X", list(self.cycles.values()))
+            for cycle, value in zip(self.cycles, values):
+                if value > 0.5:
+                    matched.update(cycle)
+        if self.arcs:
+            values = m.getAttr("X", list(self.arcs.values()))
+            for (i, j, _), value in zip(self.arcs, values):
+                if value > 0.5:
+                    matched.update((i, j))
+        return m.ObjVal, sorted(matched)
+
+
+def rebuild_objective(G, K, L, altruistic_list, env=None):
+    # optimal value of the pool with a model built from scratch
+    if len(G) == 0:
+        return 0.0
+    m = Model("Deterministic KEP", env=env) if env is not None else Model("Deterministic KEP")
+    build_formulation(m, G, K, L, altruistic_list)
+    m.ModelSense = -1 # maximize
+    m.optimize()
+    return m.ObjVal
+
+
+# INPUT
+# G - incidence list of the instance; a dictionary
+# altruistic_list - list of altruistic nodes of the instance
+# K - maximum size for cycles length
+# L - maximum length of chain size
+# periods - number of periods
+# arrival_rate - mean number of pairs entering the pool at every period (Poisson)
+# departure_rate - probability that a pair leaves the pool at the end of every period (0 for never)
+# seed - seed of the random arrivals and departures
+# check - also solve the pool with a model built from scratch at every period
+# env - gurobi environment, None for the default one
+# OUTPUT
+# generator over the records of the periods
+def simulate(G, altruistic_list, K, L=0, periods=1000, arrival_rate=1.0, departure_rate=0.0, seed=0,
+        check=False, env=None):
+    rng = np.random.default_rng(seed)
+    pred = {o: [] for o in G}
+    for i in G:
+        for j in G[i]:
+            pred.setdefault(j, []).append(i)
+    originals = np.array(sorted(pred), dtype=np.int64)
+    altruistic = set(altruistic_list)
+    # vertices of the pool copied from each original, and scheduled departures
+    copies = {o: set() for o in pred}
+    origin = {}
+    departures = {}
+    pool = DynamicKEP(K, L, env)
+    next_vertex = 0
+    for period in range(periods):
+        pool.added = pool.removed = 0
+        start = time.perf_counter()
+        with profiling.stage('update'):
+            arrivals = rng.choice(originals, rng.poisson(arrival_rate))
+            for o in arrivals.tolist():
+                v = next_vertex
+                next_vertex += 1
+                successors = [u for j in G.get(o, []) for u in copies.get(j, ())]
+                predecessors = [u for i in pred[o] for u in copies[i]]
+                pool.add(v, successors, predecessors, o in altruistic)
+                copies[o].add(v)
+                origin[v] = o
+                if departure_rate > 0:
+                    departures.setdefault(period + int(rng.geometric(departure_rate)), []).append(v)
+            leaving = [v for v in departures.pop(period, []) if v in pool]
+            for v in leaving:
+                pool.remove(v)
+                copies[origin.pop(v)].discard(v)
+            pool.m.update()
+        update_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        transplants, matched = pool.solve()
+        solve_time = time.perf_counter() - start
+        record = {'period': period, 'arrivals': len(arrivals), 'departures': len(leaving), 'pool': len(pool),
+                'cycles': len(pool.cycles), 'variables': pool.m.NumVars, 'constraints': pool.m.NumConstrs,
+                'transplants': int(round(transplants))}
+        if check:
+            start = time.perf_counter()
+            record['rebuild_objective'] = rebuild_objective(pool.graph(), K, L, sorted(pool.altruistic), env)
+            record['rebuild_time'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with profiling.stage('update'):
+            for v in matched:
+                pool.remove(v)
+                copies[origin.pop(v)].discard(v)
+        remove_time = time.perf_counter() - start
+        record.update({'added': pool.added, 'removed': pool.removed, 'update_time': update_time,
+                'solve_time': solve_time, 'remove_time': remove_time,
+                'latency': update_time + solve_time + remove_time})
+        yield record
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename')
+    parser.add_argument('--cycle-limit', type=int, default=3)
+    parser.add_argument('--chain-limit', type=int, default=3)
+    parser.add_argument('--periods', type=int, default=1000)
+    parser.add_argument('--arrival-rate', type=float, default=1.0, help="Mean number of pairs entering the pool per period")
+    parser.add_argument('--departure-rate', type=float, default=0.05,
+            help="Probability that a pair leaves the pool at the end of a period")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=None, help="Number of Gurobi threads")
+    parser.add_argument('--output', default=None, help="JSONL file where the record of every period is written")
+    parser.add_argument('--check', action='store_true',
+            help="also solve every period with a model built from scratch and compare the optimal values")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    profile_from_args(args)
+
+    setParam("OutputFlag", 0)
+    if args.threads is not None:
+        setParam("Threads", args.threads)
+    with profiling.stage('parse'):
+        G, num_V, Nb_arcs, altruistic_list = read_kep(args.filename)
+
+    out = open(args.output, 'w') if args.output is not None else None
+    records = []
+    start_time = time.time()
+    for record in simulate(G, altruistic_list, args.cycle_limit, args.chain_limit, args.periods,
+            args.arrival_rate, args.departure_rate, args.seed, args.check):
+        records.append(record)
+        if out is not None:
+            out.write(json.dumps(record) + '\n')
+    if out is not None:
+        out.close()
+    runtime = time.time() - start_time
+
+    latency = np.array([record['latency'] for record in records])
+    print('runtime: %g' % runtime)
+    print('transplants: %d' % sum(record['transplants'] for record in records))
+    print('mean pool size: %g' % np.mean([record['pool'] for record in records]))
+    print('latency per period: mean %g, max %g' % (latency.mean(), latency.max()))
+    print('update time per period: mean %g' % np.mean([record['update_time'] + record['remove_time'] for record in records]))
+    mismatches = 0
+    if args.check:
+        print('rebuild time per period: mean %g' % np.mean([record['rebuild_time'] for record in records]))
+        mismatches = sum(abs(record['rebuild_objective'] - record['transplants']) > 1e-6 for record in records)
+        print('periods with a different optimal value: %d' % mismatches)
+    write_profile(args)
+    if mismatches > 0:
+        sys.exit(1)
@@ -0,0 +1,41 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Stages of the benchmark that raise.
+"""
+import os
+
+import kep_model
+import pool_io
+from benchmark import run_instance, compare
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INSTANCE = os.path.join(HERE, '..', 'CanadianInstances', 'Graph_30_10_2009')
+CONFIG = {'cycle_limit': 3, 'chain_limit': 3, 'formulation': 'cycle', 'pool_format': 'text', 'time_limit': None,
+        'gurobi': True}
+
+
+def test_failed_stage(monkeypatch):
+    baseline = {'instances': {'g': run_instance(INSTANCE, CONFIG)}}
+
+    def fail(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(kep_model, 'build_KEP_model', fail)
+    # the stages recorded inside kep_mip
+    result = run_instance(INSTANCE, CONFIG)
+    assert result['failed'] == 'build'
+    assert result['skipped'] == ['build', 'optimize', 'pool', 'extract', 'write']
+    monkeypatch.undo()
+
+    monkeypatch.setattr(pool_io, 'save_to_file', fail)
+    result = run_instance(INSTANCE, CONFIG)
+    assert result['failed'] == 'write'
+    assert result['skipped'] == ['write']
+    assert 'write' not in result['stages']
+
+    # a stage failing in the new run is a regression, not a time or RSS change
+    result['stages']['write'] = dict(baseline['instances']['g']['stages']['write'], time=1e6)
+    regressions = compare({'instances': {'g': result}}, baseline)
+    assert 'g: write failed (disk full)' in regressions
+    # both runs are in this process, so the peak RSS of the second one includes the first
+    assert not [r for r in regressions if r.startswith('g: write ') and 'failed' not in r]
@@ -0,0 +1,30 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Pools cut by the budget of solutions.
+"""
+import os
+
+from budget import Budget, PoolMonitor
+from kep_io import read_kep
+from kep_mip import solve_KEP
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INSTANCE = os.path.join(HERE, '..', 'CanadianInstances', 'Graph_30_10_2009')
+
+
+def _pool(max_solutions=None):
+    G, num_V, Nb_arcs, altruistic_list = read_kep(INSTANCE)
+    monitor = PoolMonitor(Budget(max_solutions=max_solutions))
+    _, _, _, _, _, solutions, complete = solve_KEP(G, 3, 3, altruistic_list, monitor=monitor)
+    return sorted(sorted(solution) for solution in solutions), complete, monitor.reason
+
+
+def test_pool_budget():
+    pool, complete, _ = _pool()
+    assert complete
+    # a budget of exactly the size of the pool does not cut it
+    assert _pool(len(pool)) == (pool, True, None)
+    partial, complete, reason = _pool(len(pool) - 1)
+    assert (len(partial), complete, reason) == (len(pool) - 1, False, 'solutions')
+    assert all(solution in pool for solution in partial)
@@ -0,0 +1,32 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+The decomposed KEP against the monolithic one.
+"""
+import random
+
+from decompose import solve_decomposed
+from kep_mip import solve_KEP
+from pool_io import product_solutions
+
+
+def _graphs():
+    rng = random.Random(0)
+    for _ in range(15):
+        n = rng.randint(8, 14)
+        altruistic = rng.sample(range(n), rng.randint(0, 2))
+        G = {i: [j for j in range(n) if j != i and j not in altruistic and rng.random() < 0.15] for i in range(n)}
+        yield G, altruistic
+
+
+def test_decomposed_matches_monolithic():
+    K = 3
+    for G, altruistic in _graphs():
+        # L = 0 still lets the altruistic donors give a kidney
+        for L in [0, 1, 3]:
+            obj, _, _, _, _, solutions, complete = solve_KEP(G, K, L, altruistic)
+            expected = sorted(sorted(solution) for solution in solutions)
+            value, _, pools, decomposed_complete = solve_decomposed(G, K, L, altruistic)
+            assert complete and decomposed_complete
+            assert abs((obj or 0) - value) < 1e-6, (G, altruistic, L)
+            assert sorted(sorted(solution) for solution in product_solutions(pools)) == expected, (G, altruistic, L)
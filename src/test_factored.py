@@ -0,0 +1,86 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Factored pools against the flat pool of their products.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from alpha import uniform, compute_properties
+from fair_solver import fair_maxmin_solution
+from instance_context import InstanceContext
+from metrics import ProductDistribution, patient_marginals
+from pool_io import save_factored, save_to_file, product_solutions
+from random_solver import process_solutions
+from result_cache import ResultCache, fair_distribution
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GRAPH = os.path.join(HERE, '..', 'PortoInstances', '20-instance-1-type-information.input')
+NUM_PATIENTS = 20
+# components with disjoint patients, with a repeated patient set in the first one
+COMPONENTS = [[[0, 1], [1, 2], [2, 0], [0, 1, 2], [1, 0]],
+              [[5, 6, 7], [5, 8], [6, 8, 9], [7, 9]],
+              [[12], [13, 14], [12, 14]]]
+
+
+def _pools(tmp_path):
+    factored = str(tmp_path / 'factored')
+    flat = str(tmp_path / 'flat.txt')
+    save_factored(factored, COMPONENTS, False, NUM_PATIENTS)
+    save_to_file(flat, product_solutions(COMPONENTS), False, NUM_PATIENTS)
+    return factored, flat
+
+
+def _marginals(context, probs):
+    return patient_marginals(context.incidence, probs, NUM_PATIENTS)
+
+
+def test_factored_pool_stays_factored(tmp_path):
+    factored, flat = _pools(tmp_path)
+    context = InstanceContext(GRAPH, factored, NUM_PATIENTS)
+    assert context.pool.factored
+    assert context.pool.sizes == [4, 4, 3]
+    with pytest.raises(ValueError):
+        process_solutions(factored)
+
+    flat_context = InstanceContext(GRAPH, flat, NUM_PATIENTS)
+    assert len(flat_context.solutions) == 4 * 4 * 3
+    probs = uniform(context, NUM_PATIENTS)
+    assert isinstance(probs, ProductDistribution)
+    assert np.allclose(_marginals(context, probs), _marginals(flat_context, uniform(flat_context, NUM_PATIENTS)))
+
+    # alternative optima may differ, not the maxmin value
+    covered = sorted(set(p for component in COMPONENTS for solution in component for p in solution))
+    values = []
+    for ctx in [context, flat_context]:
+        probs = fair_distribution(None, ctx, NUM_PATIENTS, fair_maxmin_solution)
+        values.append(_marginals(ctx, probs)[covered].min())
+    assert abs(values[0] - values[1]) < 1e-6
+
+
+def test_factored_properties(tmp_path):
+    factored, flat = _pools(tmp_path)
+    for loss in [uniform, fair_maxmin_solution]:
+        results = [compute_properties(GRAPH, pool, NUM_PATIENTS, loss) for pool in [factored, flat]]
+        if loss is uniform:
+            assert np.allclose(results[0], results[1])
+        assert np.all(np.isfinite(results[0]))
+
+
+def test_factored_pool_cache(tmp_path):
+    factored, _ = _pools(tmp_path)
+    cache = ResultCache(str(tmp_path / 'cache'))
+    context = InstanceContext(GRAPH, factored, NUM_PATIENTS)
+    first = fair_distribution(cache, context, NUM_PATIENTS, fair_maxmin_solution)
+    second = fair_distribution(cache, context, NUM_PATIENTS, fair_maxmin_solution)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert isinstance(second, ProductDistribution)
+    assert all(np.array_equal(a, b) for a, b in zip(first.factors, second.factors))
+
+    # the digest covers the component files
+    digest = cache.pool_digest(factored)
+    with open(os.path.join(factored, 'component2.txt'), 'a') as f:
+        f.write('13\n')
+    assert cache.pool_digest(factored) != digest
@@ -0,0 +1,57 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Column generation against the fair distributions over the whole pool, on graphs with chains.
+"""
+import random
+
+import numpy as np
+
+from fair_colgen import fair_colgen_solution
+from fair_solver import fair_maxmin_solution, fair_l1_solution, pool_incidence
+from kep_mip import solve_KEP
+from pool_io import save_to_file
+
+
+def _probabilities(solutions, probs, num_patients):
+    q = np.zeros(num_patients)
+    for i, solution in enumerate(solutions):
+        q[solution] += probs.get(i, 0.0)
+    return q
+
+
+def _loss(loss, q, covered):
+    if loss == 'maxmin':
+        return q[sorted(covered)].min()
+    return np.abs(q - q.mean()).sum()
+
+
+def _graphs():
+    rng = random.Random(0)
+    # the pricing used to count the transplants of the chains, and missed [1, 2, 5, 6, 7, 8]
+    yield {0:[7], 1:[8], 2:[1,7], 3:[5], 4:[2,8], 5:[6], 6:[7], 7:[0,2,5], 8:[0,2,7]}, [4]
+    for _ in range(20):
+        n = rng.randint(8, 12)
+        altruistic = rng.sample(range(n), rng.randint(1, 2))
+        G = {i: [j for j in range(n) if j != i and j not in altruistic and rng.random() < 0.25] for i in range(n)}
+        yield G, altruistic
+
+
+def test_colgen_matches_pool_with_chains(tmp_path):
+    K = L = 3
+    for k, (G, altruistic) in enumerate(_graphs()):
+        filename = str(tmp_path / ('pool%d' % k))
+        n = len(G)
+        pool = [list(solution) for solution in solve_KEP(G, K, L, altruistic)[5]]
+        covered = set(p for solution in pool for p in solution)
+        if not covered:
+            continue
+        save_to_file(filename, pool, False, n)
+        # the distributions of fair_solver are over the deduplicated pool
+        A = pool_incidence(filename, n)
+        for loss, solve in [('maxmin', fair_maxmin_solution), ('l1', fair_l1_solution)]:
+            probs = solve(filename, n)
+            expected = _loss(loss, A @ np.array([probs.get(i, 0.0) for i in range(A.shape[1])]), covered)
+            solutions, probs = fair_colgen_solution(G, K, L, altruistic, n, loss)
+            value = _loss(loss, _probabilities(solutions, probs, n), covered)
+            assert abs(value - expected) < 1e-6, (G, altruistic, loss)
@@ -0,0 +1,35 @@
+"""
+Python 3
+Caches of the instance files.
+"""
+import os, shutil
+
+import numpy as np
+
+from kep_io import load_graph, load_types, CACHE_SUFFIX
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORTO = os.path.join(HERE, '..', 'PortoInstances')
+
+
+def test_cache(tmp_path):
+    graph = str(tmp_path / '20-instance-1.input')
+    types = str(tmp_path / '20-instance-1-type-information.input')
+    shutil.copy(os.path.join(PORTO, '20-instance-1.input'), graph)
+    shutil.copy(os.path.join(PORTO, '20-instance-1-type-information.input'), types)
+    cold = load_graph(graph).adjacency(), load_types(types)
+    assert os.path.isfile(graph + CACHE_SUFFIX) and os.path.isfile(types + CACHE_SUFFIX)
+    warm = load_graph(graph).adjacency(), load_types(types)
+    assert warm[0] == cold[0]
+    for name in ['pair', 'wife', 'patient', 'donor', 'pra']:
+        assert np.array_equal(getattr(warm[1], name), getattr(cold[1], name))
+
+    # a new mtime with the same content keeps the cache, a new content does not
+    os.utime(graph, ns=(0, 0))
+    assert load_graph(graph).adjacency() == cold[0]
+    with open(graph) as f:
+        lines = f.read().splitlines()
+    num_V, num_E = map(int, lines[0].split())
+    with open(graph, 'w') as f:
+        f.write('\n'.join(['%d %d' % (num_V, num_E - 1)] + lines[2:]) + '\n')
+    assert sum(len(succ) for succ in load_graph(graph).adjacency().values()) == num_E - 1
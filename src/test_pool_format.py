@@ -0,0 +1,39 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+The binary pools of the command lines on the 1-based Canadian instances.
+"""
+import os, sys, json, subprocess
+
+from pool_io import load_pool
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INSTANCE = os.path.join(HERE, '..', 'CanadianInstances', 'Graph_30_10_2009')
+
+
+def _run(script, outfile, pool_format):
+    subprocess.run([sys.executable, os.path.join(HERE, script), INSTANCE, outfile, '--pool-format', pool_format],
+            check=True, cwd=HERE, stdout=subprocess.DEVNULL)
+    return [sorted(solution) for solution in load_pool(outfile)]
+
+
+def test_binary_pool_one_based(tmp_path):
+    for script in ['kep_mip.py', 'fair_colgen.py']:
+        text = _run(script, str(tmp_path / ('%s.txt' % script)), 'text')
+        binary = _run(script, str(tmp_path / ('%s.pool' % script)), 'binary')
+        assert len(text) > 0
+        # label 30 is a patient of the instance
+        assert max(max(solution) for solution in text) == 30
+        assert binary == text
+
+
+def test_benchmark_binary_one_based(tmp_path):
+    output = str(tmp_path / 'benchmark.json')
+    instance = os.path.relpath(INSTANCE, os.path.join(HERE, '..'))
+    subprocess.run([sys.executable, os.path.join(HERE, 'benchmark.py'), '--instances', instance, '--pool-format', 'binary',
+            '--output', output], check=True, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(output) as f:
+        result = json.load(f)['instances'][instance]
+    assert 'error' not in result
+    assert 'write' in result['stages']
+    assert result['counts']['solutions'] > 0
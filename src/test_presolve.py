@@ -0,0 +1,28 @@
+"""
+Python 3
+Dominated solutions of the maxmin presolve against the pairwise definition.
+"""
+import numpy as np
+import scipy.sparse as sp
+
+from presolve import dominated_columns
+
+
+def _pool(rng, num_solutions, num_patients, sizes):
+    solutions = [rng.choice(num_patients, rng.choice(sizes), replace=False) for _ in range(num_solutions)]
+    # repeated and contained solutions
+    solutions += [solutions[k] for k in range(0, num_solutions, 7)]
+    solutions += [solutions[k][:-1] for k in range(0, num_solutions, 5) if len(solutions[k]) > 1]
+    rows = np.concatenate(solutions)
+    cols = np.repeat(np.arange(len(solutions)), [len(s) for s in solutions])
+    return [set(s.tolist()) for s in solutions], sp.csr_matrix((np.ones(len(rows)), (rows, cols)),
+            shape=(num_patients, len(solutions)))
+
+
+def test_dominated_columns():
+    rng = np.random.default_rng(0)
+    for sizes in [[4], [2, 3, 4, 5]]:
+        for block_bytes in [64, 1 << 25]:
+            solutions, A = _pool(rng, 60, 12, sizes)
+            expected = [any(t > s or (t == s and j < i) for j, t in enumerate(solutions)) for i, s in enumerate(solutions)]
+            assert dominated_columns(A, block_bytes).tolist() == expected
@@ -0,0 +1,25 @@
+"""
+Python 3
+REQUIREMENTS: GUROBI
+Keys of the cached distributions.
+"""
+import os
+
+from alpha import compute_properties
+from fair_solver import fair_maxmin_solution
+from pool_io import save_to_file
+from result_cache import ResultCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+GRAPH = os.path.join(HERE, '..', 'PortoInstances', '20-instance-1-type-information.input')
+POOL = [[0, 1, 2], [0, 1], [1, 2, 3], [3, 4], [2, 3, 4], [0, 4]]
+
+
+def test_settings_in_key(tmp_path):
+    pool = str(tmp_path / 'pool.txt')
+    save_to_file(pool, POOL, False, 20)
+    cache = ResultCache(str(tmp_path / 'cache'))
+    for settings in [None, {'presolve': True}, {'presolve': False}, {'presolve': True, 'l2_solver': 'qp'}]:
+        compute_properties(GRAPH, pool, 20, fair_maxmin_solution, cache=cache, settings=settings)
+    # presolve is on by default
+    assert (cache.hits, cache.misses) == (1, 3)